@@ -13,6 +13,21 @@ from fpdf import FPDF
 import os
 from io import BytesIO
 import json
+import uuid
+from motor_rating import (
+    PESOS_PILARES, converter_score_para_rating, ajustar_rating, calcular_score_final,
+    calcular_score_pilar1, calcular_score_pilar2, calcular_score_pilar3,
+    calcular_spread_credito, calcular_taxas_indicativas, gerar_fluxo_cci, calcular_duration,
+    CAMPOS_PRECIFICACAO, TODOS_CAMPOS, avaliar_lote, LIMITES_RATING, MATRIZ_SPREAD_BASE, SPREAD_PADRAO,
+)
+from armazem_fluxos import TAMANHO_ID, ArmazemFluxos
+from indice_espacial import IndiceEspacial, analisar_comparaveis
+from indice_precos import BaseIndicesPrecos
+from historico_ratings import HistoricoRatings
+from area_carteira import (
+    AreaCarteiras, avaliar_em_blocos, chave_arquivo, consolidar_carteira, contar_operacoes, ler_em_blocos, primeira_linha_dados,
+)
+from memoria_sessao import ArmazemArtefatos, chave_conteudo, relatorio_memoria
 
 # ==============================================================================
 # INICIALIZAÇÃO E FUNÇÕES AUXILIARES
@@ -22,9 +37,9 @@ def inicializar_session_state():
     """Garante que todos os valores de input e scores sejam inicializados no st.session_state apenas uma vez."""
     if 'state_initialized_cci' not in st.session_state:
         st.session_state.state_initialized_cci = True
+        st.session_state.sessao_id = uuid.uuid4().hex
         st.session_state.scores = {}
         st.session_state.map_data = None
-        st.session_state.fluxo_cci_df = pd.DataFrame()
 
         default_emissao = datetime.date(2024, 5, 1)
         default_prazo_meses = 120 # 10 anos
@@ -42,6 +57,7 @@ def inicializar_session_state():
             'credibilidade_avaliador': '1ª Linha Nacional', 'qualidade_comparaveis': 'Sim',
             'estresse_valor_perc': 15.0, 'fipezap_12m': 5.2, 'liquidez_dias': 120,
             'risco_oferta': 'Baixo, bairro consolidado', 'cidade_mapa': 'São Paulo, SP',
+            'endereco_imovel': '', 'raio_comparaveis_km': 2.0,
             'adequacao_produto': 'Ideal', 'reputacao_construtora': '1ª Linha',
             'estado_conservacao': 'Novo/Reformado', 'tipo_imovel': 'Residencial (Apartamento/Casa)',
             'analise_dominial_20a': True, 'cnds_verificadas': ['CND do Imóvel (IPTU)', 'CND do Devedor'],
@@ -83,16 +99,110 @@ def inicializar_session_state():
             if key not in st.session_state:
                 st.session_state[key] = value
 
-@st.cache_data
+# ==============================================================================
+# RECURSOS COMPARTILHADOS (UM POR PROCESSO)
+# ==============================================================================
+
+@st.cache_resource
+def obter_geocodificador():
+    """Geocodificador Nominatim com limite de 1 requisição/s, compartilhado por todas as sessões."""
+    return RateLimiter(Nominatim(user_agent="cci_analyzer_app").geocode, min_delay_seconds=1)
+
+@st.cache_resource
+def obter_modelo_ia():
+    """Cliente do Gemini, configurado uma vez por processo; sem a chave da API levanta exceção, que não fica em cache."""
+    genai.configure(api_key=st.secrets["GEMINI_API_KEY"])
+    return genai.GenerativeModel('gemini-1.5-flash')
+
+@st.cache_resource
+def obter_tabelas_metodologia():
+    """Tabelas de referência da metodologia (pesos, faixas de score e spreads base) montadas uma vez por processo."""
+    nomes_pilares = {'pilar1': 'Pilar I: Lastro Imobiliário', 'pilar2': 'Pilar II: Crédito e Devedor', 'pilar3': 'Pilar III: Estrutura e Performance'}
+    pesos = pd.DataFrame({'Pilar': [nomes_pilares[p] for p in PESOS_PILARES], 'Peso': [f"{w:.0%}" for w in PESOS_PILARES.values()]})
+    faixas = pd.DataFrame({'Rating': [r for _, r in LIMITES_RATING] + ['brD(sf)'],
+                           'Score Mínimo': [f"{limite:.2f}" for limite, _ in LIMITES_RATING] + ['1.00'],
+                           'Spread Base (% a.a.)': [f"{MATRIZ_SPREAD_BASE.get(r, SPREAD_PADRAO):.2f}" for _, r in LIMITES_RATING] + [f"{SPREAD_PADRAO:.2f}"]})
+    return {'pesos': pesos, 'faixas': faixas}
+
+@st.cache_resource
+def obter_armazem_artefatos():
+    """Relatórios PDF e textos de IA das sessões, guardados uma única vez no processo e referenciados por chave."""
+    return ArmazemArtefatos()
+
+def guardar_artefato(rotulo, conteudo, chave=None):
+    st.session_state[f'{rotulo}_id'] = obter_armazem_artefatos().guardar(st.session_state.sessao_id, rotulo, conteudo, chave)
+
+def obter_artefato(rotulo):
+    chave = st.session_state.get(f'{rotulo}_id')
+    return obter_armazem_artefatos().obter(chave, st.session_state.sessao_id) if chave else None
+
+@st.cache_data(max_entries=1024, ttl=datetime.timedelta(days=7))
+def _geocodificar(endereco):
+    # Falhas de rede levantam exceção e não ficam em cache; endereço não encontrado fica (None)
+    location = obter_geocodificador()(endereco)
+    if location: return pd.DataFrame({'lat': [location.latitude], 'lon': [location.longitude]})
+    return None
+
 def get_coords(city):
     if not city: return None
     try:
-        geolocator = Nominatim(user_agent="cci_analyzer_app")
-        geocode = RateLimiter(geolocator.geocode, min_delay_seconds=1)
-        location = geocode(city)
-        if location: return pd.DataFrame({'lat': [location.latitude], 'lon': [location.longitude]})
+        return _geocodificar(city)
     except Exception: return None
 
+@st.cache_resource
+def carregar_indice_comparaveis():
+    """Carrega (uma vez por processo) a base local de imóveis de referência, se existir."""
+    for caminho in ("dados/comparaveis.parquet", "dados/comparaveis.csv"):
+        if os.path.exists(caminho): return IndiceEspacial.de_arquivo(caminho)
+    return None
+
+@st.cache_resource
+def carregar_base_indices_precos():
+    """Carrega (uma vez por processo) as séries locais de índice de preço e tempo de venda, se existirem."""
+    if os.path.isdir("dados/indices_precos"): return BaseIndicesPrecos.de_diretorio("dados/indices_precos")
+    return None
+
+@st.cache_resource
+def obter_armazem_fluxos():
+    """Armazém de fluxos de caixa mapeado em memória, compartilhado por todas as sessões do processo."""
+    return ArmazemFluxos("dados/fluxos")
+
+@st.cache_resource
+def obter_historico_ratings():
+    """Histórico de eventos de rating (partições mensais), compartilhado por todas as sessões do processo."""
+    return HistoricoRatings("dados/historico_ratings")
+
+@st.cache_resource
+def obter_area_carteiras():
+    """Carteiras avaliadas na área de trabalho, guardadas no servidor e compartilhadas por todas as sessões."""
+    return AreaCarteiras()
+
+def processar_carteira(arquivo, preencher_indices):
+    """Lê e avalia o arquivo em blocos com barra de progresso; guarda o resultado na área pela chave do arquivo."""
+    conteudo = arquivo.getvalue()
+    base = carregar_base_indices_precos() if preencher_indices else None
+    referencia = datetime.date.today()
+    # O preenchimento depende do mês de referência: o mesmo arquivo em outro mês é outra carteira
+    chave = chave_arquivo(conteudo) + (f'-indices-{referencia:%Y-%m}' if base is not None else '')
+    area = obter_area_carteiras()
+    if chave not in area:
+        def preparar(bloco):
+            if base is None or 'cidade_mapa' not in bloco.columns: return bloco
+            return base.preencher_operacoes(bloco, data_referencia=referencia)
+
+        total = contar_operacoes(conteudo, arquivo.name)
+        barra = st.progress(0.0, text="Avaliando carteira...")
+        partes, exposicoes, recusadas = [], [], []
+        blocos = ler_em_blocos(conteudo, arquivo.name)
+        for parte, exposicao, recusadas_bloco, processadas in avaliar_em_blocos(blocos, preparar, primeira_linha_dados(arquivo.name)):
+            partes.append(parte)
+            exposicoes.append(exposicao)
+            recusadas.append(recusadas_bloco)
+            barra.progress(min(1.0, processadas / max(total, 1)), text=f"{processadas:,} de {total:,} operações avaliadas")
+        area.guardar(chave, consolidar_carteira(partes, exposicoes, recusadas))
+        barra.empty()
+    st.session_state.carteira_chave = chave
+
 def create_gauge_chart(score, title):
     if score is None: score = 1.0
     fig = go.Figure(go.Indicator(
@@ -109,27 +219,6 @@ def create_gauge_chart(score, title):
     fig.update_layout(height=250, margin={'t':40, 'b':40, 'l':30, 'r':30})
     return fig
 
-def converter_score_para_rating(score):
-    if score is None: return "N/A"
-    if score >= 4.75: return 'brAAA(sf)'
-    elif score >= 4.25: return 'brAA(sf)'
-    elif score >= 3.75: return 'brA(sf)'
-    elif score >= 3.25: return 'brBBB(sf)'
-    elif score >= 2.75: return 'brBB(sf)'
-    elif score >= 2.50: return 'brB(sf)'
-    elif score >= 2.25: return 'brCCC(sf)'
-    elif score >= 2.00: return 'brCC(sf)'
-    elif score >= 1.50: return 'brC(sf)'
-    else: return 'brD(sf)'
-
-def ajustar_rating(rating_base, notches):
-    escala = ['brD(sf)', 'brC(sf)','brCC(sf)','brCCC(sf)', 'brB(sf)', 'brBB(sf)', 'brBBB(sf)', 'brA(sf)', 'brAA(sf)', 'brAAA(sf)']
-    try:
-        idx_base = escala.index(rating_base)
-        idx_final = max(0, min(len(escala) - 1, idx_base + notches))
-        return escala[idx_final]
-    except (ValueError, TypeError): return rating_base
-
 class PDF(FPDF):
     def header(self):
         # Adiciona o logo no canto superior esquerdo do PDF
@@ -203,6 +292,10 @@ class PDF(FPDF):
         self.multi_cell(0, 5, self._write_text(texto_analise))
         self.ln(5)
 
+CAMPOS_RELATORIO = ['op_nome', 'op_codigo', 'op_volume', 'op_indexador', 'op_taxa', 'op_data_emissao', 'op_data_vencimento',
+                    'op_emissor', 'op_amortizacao', 'scores', 'ajuste_final', 'justificativa_final',
+                    'analise_p1_id', 'analise_p2_id', 'analise_p3_id']
+
 def gerar_relatorio_pdf(ss):
     try:
         pdf = PDF()
@@ -210,11 +303,10 @@ def gerar_relatorio_pdf(ss):
         pdf.chapter_title('1. Dados Cadastrais da Operação')
         pdf.TabelaCadastro(ss)
 
-        pesos_cci = {'pilar1': 0.30, 'pilar2': 0.40, 'pilar3': 0.30}
         pdf.chapter_title('2. Scorecard e Rating Final')
-        pdf.TabelaScorecard(ss, pesos_cci)
+        pdf.TabelaScorecard(ss, PESOS_PILARES)
 
-        score_final_ponderado = sum(ss.scores.get(p, 1) * w for p, w in pesos_cci.items())
+        score_final_ponderado = calcular_score_final(ss.scores)
         rating_indicado = converter_score_para_rating(score_final_ponderado)
         rating_final = ajustar_rating(rating_indicado, ss.ajuste_final)
 
@@ -228,11 +320,11 @@ def gerar_relatorio_pdf(ss):
         pdf.chapter_title('3. Análise Qualitativa com IA Gemini')
         nomes_pilares = ["Lastro Imobiliário", "Crédito e Devedor", "Estrutura e Performance"]
         for i in range(1, 4):
-            analise_key = f'analise_p{i}'
-            if ss.get(analise_key):
+            analise = obter_artefato(f'analise_p{i}')
+            if analise:
                 pdf.set_font('Arial', 'B', 12)
                 pdf.cell(0, 10, f"Análise do Pilar {i}: {nomes_pilares[i-1]}", 0, 1)
-                pdf.AnaliseIA(ss[analise_key])
+                pdf.AnaliseIA(analise)
 
         buffer = BytesIO()
         pdf.output(buffer)
@@ -242,206 +334,14 @@ def gerar_relatorio_pdf(ss):
         st.error(f"Ocorreu um erro crítico ao gerar o PDF: {e}")
         return b''
 
-# ==============================================================================
-# FUNÇÕES DE CÁLCULO DE SCORE
-# ==============================================================================
-def calcular_score_pilar1_lastro_robusto():
-    scores_aval_loc = []
-    map_cred_aval = {'1ª Linha Nacional': 5, 'Regional Conhecido': 4, 'Pouco Conhecido': 2}
-    map_qual_comp = {'Sim': 5, 'Parcialmente': 3, 'Não': 1}
-    scores_aval_loc.extend([map_cred_aval[st.session_state.credibilidade_avaliador], map_qual_comp[st.session_state.qualidade_comparaveis]])
-
-    valor_imovel = st.session_state.valor_avaliacao_imovel
-    valor_estressado = valor_imovel * (1 - st.session_state.estresse_valor_perc / 100)
-    ltv_estressado = (st.session_state.saldo_devedor_credito / valor_estressado) * 100 if valor_estressado > 0 else 999
-    if ltv_estressado < 70: scores_aval_loc.append(5)
-    elif ltv_estressado < 85: scores_aval_loc.append(3)
-    else: scores_aval_loc.append(1)
-
-    fipezap = st.session_state.fipezap_12m
-    if fipezap > 7.5: scores_aval_loc.append(5)
-    elif fipezap > 0: scores_aval_loc.append(4)
-    else: scores_aval_loc.append(2)
-
-    liquidez_dias = st.session_state.liquidez_dias
-    if liquidez_dias <= 90: scores_aval_loc.append(5)
-    elif liquidez_dias <= 180: scores_aval_loc.append(3)
-    else: scores_aval_loc.append(1)
-
-    map_risco_oferta = {'Baixo, bairro consolidado': 5, 'Médio, alguns lançamentos': 3, 'Alto, muitos lançamentos': 1}
-    scores_aval_loc.append(map_risco_oferta[st.session_state.risco_oferta])
-    score_aval_loc = np.mean(scores_aval_loc) if scores_aval_loc else 1
-
-    scores_fisico = []
-    map_adequacao = {'Ideal': 5, 'Adequado': 4, 'Pouco Adequado': 2}
-    map_rep_const = {'1ª Linha': 5, 'Média': 3, 'Baixa/Desconhecida': 2}
-    map_conserv = {'Novo/Reformado': 5, 'Bom, com manutenção': 4, 'Regular, necessita reparos': 2, 'Ruim': 1}
-    scores_fisico.extend([map_adequacao[st.session_state.adequacao_produto], map_rep_const[st.session_state.reputacao_construtora], map_conserv[st.session_state.estado_conservacao]])
-    score_fisico = np.mean(scores_fisico) if scores_fisico else 1
-
-    scores_legal = []
-    scores_legal.append(5 if st.session_state.analise_dominial_20a else 2)
-    scores_legal.append(5 if st.session_state.dividas_propter_rem else 1)
-    score_cnds = 1 + len(st.session_state.cnds_verificadas)
-    scores_legal.append(min(5, score_cnds))
-    map_risco_amb = {'Inexistente': 5, 'Baixo/Gerenciado': 4, 'Requer análise': 2}
-    scores_legal.append(map_risco_amb[st.session_state.risco_ambiental_imovel])
-    score_legal = np.mean(scores_legal) if scores_legal else 1
-
-    score_final_pilar1 = (score_aval_loc * 0.50) + (score_fisico * 0.25) + (score_legal * 0.25)
-    return score_final_pilar1
-
-def calcular_score_pilar2_credito_robusto():
-    scores_credito = []
-    ltv = st.session_state.ltv_operacao
-    if ltv < 50: scores_credito.append(5)
-    elif ltv <= 70: scores_credito.append(3)
-    else: scores_credito.append(1)
-
-    map_finalidade = {'Financiamento de Aquisição': 5, 'Financiamento à Construção': 3, 'Home Equity': 1}
-    scores_credito.append(map_finalidade[st.session_state.finalidade_credito])
-
-    if st.session_state.op_amortizacao == 'SAC': scores_credito.append(5)
-    else: scores_credito.append(4)
-
-    score_credito = np.mean(scores_credito) if scores_credito else 1
-
-    scores_devedor = []
-    if st.session_state.tipo_lastro_credito == 'Crédito Único':
-        if st.session_state.tipo_devedor == 'Pessoa Física':
-            renda_mensal = st.session_state.renda_mensal_pf
-            dti = (st.session_state.parcela_mensal_pf / renda_mensal) * 100 if renda_mensal > 0 else 999
-            if dti <= 30: scores_devedor.append(5)
-            elif dti <= 40: scores_devedor.append(3)
-            else: scores_devedor.append(1)
-
-            map_score_credito = {'Excelente (>800)': 5, 'Bom (600-800)': 4, 'Regular (400-600)': 2, 'Ruim (<400)': 1}
-            scores_devedor.append(map_score_credito[st.session_state.score_credito_devedor])
-
-            map_patrimonio = {'> R$ 1.000.000': 5, 'R$ 250k - R$ 1.000.000': 4, '< R$ 250k': 2}
-            scores_devedor.append(map_patrimonio[st.session_state.patrimonio_liquido_pf])
-        else:
-            dl_ebitda = st.session_state.dl_ebitda_pj
-            if dl_ebitda < 2.0: scores_devedor.append(5)
-            elif dl_ebitda <= 4.0: scores_devedor.append(3)
-            else: scores_devedor.append(1)
-
-            liq_corr = st.session_state.liq_corrente_pj
-            if liq_corr > 1.5: scores_devedor.append(5)
-            elif liq_corr >= 1.0: scores_devedor.append(3)
-            else: scores_devedor.append(1)
-
-            dscr = st.session_state.dscr_pj
-            if dscr > 1.5: scores_devedor.append(5)
-            elif dscr >= 1.2: scores_devedor.append(3)
-            else: scores_devedor.append(1)
-    else:
-        num_dev = st.session_state.num_devedores
-        if num_dev > 50: scores_devedor.append(5)
-        elif num_dev > 10: scores_devedor.append(4)
-        else: scores_devedor.append(2)
-
-        conc_top5 = st.session_state.concentracao_top5
-        if conc_top5 < 30: scores_devedor.append(5)
-        elif conc_top5 <= 50: scores_devedor.append(3)
-        else: scores_devedor.append(1)
-
-    score_devedor = np.mean(scores_devedor) if scores_devedor else 1
-
-    score_performance = 4.0
-    if st.session_state.historico_pagamento != 'Novo, sem histórico de pagamento':
-        scores_perf = []
-        map_hist_pag = {'Pagamentos em dia por > 12 meses': 5, 'Pagamentos em dia por < 12 meses': 4, 'Com histórico de atrasos': 1}
-        scores_perf.append(map_hist_pag[st.session_state.historico_pagamento])
-
-        inad_90d = st.session_state.inadimplencia_90d
-        if inad_90d == 0: scores_perf.append(5)
-        elif inad_90d <= 2: scores_perf.append(3)
-        else: scores_perf.append(1)
-
-        score_performance = np.mean(scores_perf) if scores_perf else 1
-
-    score_final_pilar2 = (score_credito * 0.40) + (score_devedor * 0.40) + (score_performance * 0.20)
-    return score_final_pilar2
-
-def calcular_score_pilar3_estrutura_robusto():
-    # --- Subfator 1: Estrutura (Prestadores de Serviço) ---
-    scores_estrutura = []
-    map_reputacao = {'Banco de 1ª linha / Emissor especialista': 5, 'Instituição financeira média': 4, 'Securitizadora de nicho': 3, 'Emissor pouco conhecido ou com histórico negativo': 1}
-    map_servicer = {'Interna, com alta especialização': 5, 'Externa, 1ª linha': 4, 'Externa, padrão de mercado': 3, 'Servicer com histórico fraco': 1}
-    scores_estrutura.extend([map_reputacao[st.session_state.reputacao_emissor], map_servicer[st.session_state.qualidade_servicer]])
-    score_estrutura = np.mean(scores_estrutura) if scores_estrutura else 1
-
-    # --- Subfator 2: Performance e Inadimplência ---
-    score_performance = 4.0 # Nota neutra/positiva para operações novas
-    if st.session_state.historico_pagamento != 'Novo, sem histórico de pagamento':
-        scores_perf = []
-        
-        # Score de Inadimplência Ponderada
-        inad_ponderada = (st.session_state.perc_inad_30_60_dias * 1) + \
-                         (st.session_state.perc_inad_60_90_dias * 2) + \
-                         (st.session_state.perc_inad_90_180_dias * 4) + \
-                         (st.session_state.perc_inad_acima_180_dias * 8)
-        
-        if inad_ponderada <= 2: scores_perf.append(5)
-        elif inad_ponderada <= 5: scores_perf.append(4)
-        elif inad_ponderada <= 10: scores_perf.append(3)
-        elif inad_ponderada <= 20: scores_perf.append(2)
-        else: scores_perf.append(1)
-
-        # Score de Indicadores Dinâmicos
-        taxa_cura = st.session_state.taxa_cura_mensal
-        if taxa_cura >= 50: scores_perf.append(5)
-        elif taxa_cura >= 20: scores_perf.append(3)
-        else: scores_perf.append(1)
-
-        roll_rate = st.session_state.roll_rate_mensal
-        if roll_rate <= 1: scores_perf.append(5)
-        elif roll_rate <= 3: scores_perf.append(3)
-        else: scores_perf.append(1)
-
-        map_reneg = {'Sem histórico de renegociação': 5, 'Renegociações pontuais e bem-sucedidas': 4, 'Renegociações recorrentes ou com perdas': 1}
-        scores_perf.append(map_reneg[st.session_state.historico_renegociacao])
-
-        score_performance = np.mean(scores_perf) if scores_perf else 1
-
-    # --- Ponderação Final do Pilar (INVERTIDA) ---
-    peso_estrutura = 0.8 if st.session_state.historico_pagamento == 'Novo, sem histórico de pagamento' else 0.3
-    peso_performance = 1 - peso_estrutura
-    score_final_pilar3 = (score_estrutura * peso_estrutura) + (score_performance * peso_performance)
-    return score_final_pilar3
-
-# ==============================================================================
-# FUNÇÕES DE CÁLCULO FINANCEIRO
-# ==============================================================================
-
-def calcular_spread_credito(rating, duration_anos, op_volume):
-    matriz_spread_base = {
-        'brAAA(sf)': 3.50, 'brAA(sf)': 4.00, 'brA(sf)': 4.50,
-        'brBBB(sf)': 5.50, 'brBB(sf)': 6.50, 'brB(sf)': 7.50,
-        'brCCC(sf)': 9.50,
-    }
-    base_spread = matriz_spread_base.get(rating, 10.00)
-    liquidity_premium = 0.30 if op_volume < 5_000_000 else 0.10
-    duration_adjustment = (duration_anos - 5) * 0.08
-
-    home_equity_penalty = 0.0
-    if st.session_state.finalidade_credito == 'Home Equity':
-        home_equity_penalty = 0.65  # Adiciona 0.65% (65 bps) de spread. Você pode ajustar este valor.
-
-    total_spread = base_spread + liquidity_premium + duration_adjustment + home_equity_penalty
-    
-    return max(0.5, total_spread)
-
 # ==============================================================================
 # FUNÇÕES DE ANÁLISE COM IA
 # ==============================================================================
-@st.cache_data
-def gerar_analise_ia(nome_pilar, dados_pilar_str):
-    try:
-        genai.configure(api_key=st.secrets["GEMINI_API_KEY"])
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        prompt = f"""
+@st.cache_data(max_entries=256, ttl=datetime.timedelta(days=1))
+def _consultar_modelo_ia(nome_pilar, dados_pilar_str):
+    # Só respostas bem-sucedidas ficam em cache: erros de chave ou de chamada levantam exceção
+    model = obter_modelo_ia()
+    prompt = f"""
         Aja como um analista de crédito sênior, especialista em Cédulas de Crédito Imobiliário (CCI) no Brasil.
         Sua tarefa é analisar os dados do pilar '{nome_pilar}' de uma operação de CCI e fornecer uma análise qualitativa concisa em português.
         Estruture sua resposta em "Pontos Positivos" e "Pontos de Atenção".
@@ -451,12 +351,96 @@ def gerar_analise_ia(nome_pilar, dados_pilar_str):
         {dados_pilar_str}
         ---
         """
-        response = model.generate_content(prompt)
-        return response.text
+    response = model.generate_content(prompt)
+    return response.text
+
+def gerar_analise_ia(nome_pilar, dados_pilar_str):
+    try:
+        return _consultar_modelo_ia(nome_pilar, dados_pilar_str)
     except Exception as e:
         st.error(f"Erro ao chamar API do Gemini: {e}")
         return "Erro: A chave da API do Gemini (GEMINI_API_KEY) não foi encontrada ou a chamada falhou."
 
+def exibir_analise_ia(rotulo, callback):
+    """Exibe a análise guardada; se ela foi descartada do armazém de artefatos, avisa e oferece gerá-la de novo."""
+    analise = obter_artefato(rotulo)
+    if analise:
+        with st.container(border=True): st.markdown(analise)
+    elif st.session_state.get(f'{rotulo}_id'):
+        st.warning("A análise gerada foi descartada da memória do servidor (limite de memória atingido).")
+        st.button("Gerar a Análise Novamente", key=f'regenerar_{rotulo}', use_container_width=True, on_click=callback)
+
+def callback_preencher_indices_precos():
+    base = carregar_base_indices_precos()
+    regiao, hoje = st.session_state.cidade_mapa, datetime.date.today()
+    mes_utilizado = base.mes_utilizado(hoje)
+    if mes_utilizado is None:
+        st.session_state.resumo_indices_precos = {'erro': f"A base local de índices está defasada em mais de {base.max_defasagem_meses} meses; nenhum campo foi alterado."}
+        return
+    variacao, liquidez = base.variacao_12m(regiao, hoje), base.liquidez_dias(regiao, hoje)
+    if variacao is not None: st.session_state.fipezap_12m = round(variacao, 2)
+    if liquidez is not None: st.session_state.liquidez_dias = int(round(liquidez))
+    volatilidade = base.volatilidade(regiao, hoje)
+    st.session_state.resumo_indices_precos = {'encontrado': variacao is not None or liquidez is not None, 'volatilidade': volatilidade,
+                                              'mes': mes_utilizado[0], 'defasagem_meses': mes_utilizado[1]}
+
+def callback_sugerir_comparaveis():
+    indice = carregar_indice_comparaveis()
+    endereco = st.session_state.endereco_imovel.strip()
+    if indice is None or not endereco:
+        st.session_state.resumo_comparaveis = {'erro': "Informe o endereço do imóvel para buscar comparáveis na base local."}
+        return
+    # O centróide da cidade não serve de referência: os campos do Pilar 1 só são sugeridos a partir do endereço
+    coords = get_coords(f"{endereco}, {st.session_state.cidade_mapa}")
+    if coords is None:
+        st.session_state.resumo_comparaveis = {'erro': "Endereço não localizado; nenhum campo foi alterado."}
+        return
+    lat, lon = coords['lat'].iloc[0], coords['lon'].iloc[0]
+    analise = analisar_comparaveis(indice, lat, lon, st.session_state.raio_comparaveis_km,
+                                   st.session_state.op_data_emissao.year, st.session_state.tipo_imovel)
+    comparaveis = analise['comparaveis']
+    st.session_state.qualidade_comparaveis = analise['qualidade_comparaveis']
+    if analise['risco_oferta'] is not None:
+        st.session_state.risco_oferta = analise['risco_oferta']
+    st.session_state.resumo_comparaveis = {
+        'qtd': len(comparaveis),
+        'distancia_mediana_km': float(comparaveis['distancia_km'].median()) if len(comparaveis) else None,
+        'valor_mediano': float(comparaveis['valor'].median()) if 'valor' in comparaveis.columns and len(comparaveis) else None,
+    }
+    st.session_state.map_data = pd.concat([coords, comparaveis[['lat', 'lon']]], ignore_index=True)
+
+def callback_gerar_fluxo():
+    entradas = [st.session_state[c] for c in ('op_volume', 'op_taxa', 'op_prazo', 'op_amortizacao', 'op_data_emissao')]
+    fluxo = gerar_fluxo_cci(*entradas)
+    # O armazém é compartilhado entre as sessões: a chave vem das entradas do fluxo, não do código
+    # digitado, e entradas iguais geram o mesmo fluxo
+    chave = chave_conteudo('fluxo', *entradas)[:TAMANHO_ID]
+    armazem = obter_armazem_fluxos()
+    if chave not in armazem: armazem.adicionar(chave, fluxo)
+    st.session_state.fluxo_cci_id = chave
+    st.session_state.fluxo_cci_op = st.session_state.op_codigo
+    st.session_state.precificacao_duration_manual = max(0.1, round(calcular_duration(fluxo['parcela'], st.session_state.op_taxa), 2))
+
+def callback_registrar_rating():
+    campos = ['op_codigo'] + TODOS_CAMPOS + list(CAMPOS_PRECIFICACAO)
+    operacao = pd.DataFrame([{campo: st.session_state.get(campo) for campo in dict.fromkeys(campos)}])
+    scores = st.session_state.scores
+    # Os pilares exibidos só mudam pelos botões de cálculo: se as entradas mudaram depois, o registro é recusado
+    recalculado = avaliar_lote(operacao)
+    if not all(np.isclose(recalculado[pilar].iloc[0], scores.get(pilar, np.nan)) for pilar in PESOS_PILARES):
+        st.session_state.rating_registrado = False
+        return
+    score_final = calcular_score_final(scores)
+    rating_final = ajustar_rating(converter_score_para_rating(score_final), st.session_state.ajuste_final)
+    exibido = pd.DataFrame([{
+        **{pilar: scores[pilar] for pilar in PESOS_PILARES}, 'score_final': score_final,
+        'rating_indicado': converter_score_para_rating(score_final), 'rating_final': rating_final,
+        'spread_credito': calcular_spread_credito(rating_final, st.session_state.precificacao_duration_manual,
+                                                  st.session_state.op_volume, st.session_state.finalidade_credito),
+    }])
+    obter_historico_ratings().registrar_resultado(operacao, exibido, origem='app')
+    st.session_state.rating_registrado = True
+
 def callback_gerar_analise_p1():
     dados_p1_str = f"""
     - **Avaliação e Localização**:
@@ -475,7 +459,7 @@ def callback_gerar_analise_p1():
       - Risco Ambiental: {st.session_state.risco_ambiental_imovel}
     """
     with st.spinner("Analisando o Pilar 1..."):
-        st.session_state.analise_p1 = gerar_analise_ia("Pilar 1: Lastro Imobiliário", dados_p1_str)
+        guardar_artefato('analise_p1', gerar_analise_ia("Pilar 1: Lastro Imobiliário", dados_p1_str))
 
 def callback_gerar_analise_p2():
     dados_p2_str = f"""
@@ -512,7 +496,7 @@ def callback_gerar_analise_p2():
       - Maior Atraso Observado: {st.session_state.maior_atraso_hist}"""
 
     with st.spinner("Analisando o Pilar 2..."):
-        st.session_state.analise_p2 = gerar_analise_ia("Pilar 2: Crédito e Devedor", dados_p2_str)
+        guardar_artefato('analise_p2', gerar_analise_ia("Pilar 2: Crédito e Devedor", dados_p2_str))
 
 def callback_gerar_analise_p3():
     dados_p3_str = f"""
@@ -531,7 +515,7 @@ def callback_gerar_analise_p3():
       - Histórico de Renegociação: {st.session_state.historico_renegociacao}
     """
     with st.spinner("Analisando o Pilar 3..."):
-        st.session_state.analise_p3 = gerar_analise_ia("Pilar 3: Estrutura e Performance", dados_p3_str)
+        guardar_artefato('analise_p3', gerar_analise_ia("Pilar 3: Estrutura e Performance", dados_p3_str))
 
 # ==============================================================================
 # CORPO PRINCIPAL DA APLICAÇÃO
@@ -554,6 +538,8 @@ with col2:
 st.divider()
 
 inicializar_session_state()
+CHAVES_ARTEFATOS = ['analise_p1', 'analise_p2', 'analise_p3']
+CHAVES_INTERNAS = {'state_initialized_cci', 'sessao_id', 'carteira_chave', 'relatorio_pdf_id'} | {f'{r}_id' for r in CHAVES_ARTEFATOS}
 
 st.sidebar.title("Gestão da Análise")
 st.sidebar.divider()
@@ -564,6 +550,10 @@ if st.sidebar.button("2. Carregar Dados", disabled=(uploaded_file is None), use_
         for key, value in loaded_state_dict.items():
             if key in ['op_data_emissao', 'op_data_vencimento'] and isinstance(value, str):
                 st.session_state[key] = datetime.datetime.strptime(value, '%Y-%m-%d').date()
+            elif key in CHAVES_ARTEFATOS:
+                if value: guardar_artefato(key, value)
+            elif key in CHAVES_INTERNAS:
+                continue
             else:
                 st.session_state[key] = value
         st.session_state.state_initialized_cci = True
@@ -572,7 +562,10 @@ if st.sidebar.button("2. Carregar Dados", disabled=(uploaded_file is None), use_
     except Exception as e:
         st.sidebar.error(f"Erro ao carregar: {e}")
 
-state_to_save = {k: v for k, v in st.session_state.items() if k != 'state_initialized_cci'}
+# Referências a artefatos são substituídas pelo conteúdo; identificadores internos da sessão não são salvos
+state_to_save = {k: v for k, v in st.session_state.items() if k not in CHAVES_INTERNAS}
+artefatos_sessao = {rotulo: obter_artefato(rotulo) for rotulo in CHAVES_ARTEFATOS}
+state_to_save.update({rotulo: conteudo for rotulo, conteudo in artefatos_sessao.items() if conteudo})
 json_string = json.dumps(state_to_save, indent=4, default=str)
 file_name = state_to_save.get('op_nome', 'analise_cci').replace(' ', '_') + ".json"
 st.sidebar.divider()
@@ -580,9 +573,9 @@ st.sidebar.download_button(label="Salvar Análise Atual", data=json_string, file
                            mime="application/json", use_container_width=True)
 
 # --- DEFINIÇÃO DAS ABAS ---
-tab0, tab1, tab2, tab3, tab_prec, tab_res, tab_met = st.tabs([
+tab0, tab1, tab2, tab3, tab_prec, tab_res, tab_cart, tab_met = st.tabs([
     "Cadastro", "Pilar I: Lastro Imobiliário", "Pilar II: Crédito e Devedor",
-    "Pilar III: Estrutura e Performance", "Precificação", "Resultado", "Metodologia"
+    "Pilar III: Estrutura e Performance", "Precificação", "Resultado", "Carteira", "Metodologia"
 ])
 
 with tab0:
@@ -629,6 +622,38 @@ with tab1:
         with c3:
             st.selectbox("Risco de Excesso de Oferta:", ['Baixo, bairro consolidado', 'Médio, alguns lançamentos', 'Alto, muitos lançamentos'], key='risco_oferta')
         st.text_input("Cidade/Estado para Mapa:", key='cidade_mapa')
+        st.button("Preencher FipeZAP e Liquidez (Base Local)", use_container_width=True,
+                  on_click=callback_preencher_indices_precos, disabled=carregar_base_indices_precos() is None,
+                  help="Usa as séries em dados/indices_precos/*.csv (colunas regiao, mes, indice, dias_venda). Bairros no formato 'Cidade, UF/Bairro'.")
+        resumo_precos = st.session_state.get('resumo_indices_precos')
+        if resumo_precos and 'erro' in resumo_precos:
+            st.warning(resumo_precos['erro'])
+        elif resumo_precos and not resumo_precos['encontrado']:
+            st.warning("Região não encontrada na base local de índices.")
+        elif resumo_precos:
+            if resumo_precos['defasagem_meses'] > 0:
+                st.warning(f"Índices de {resumo_precos['mes']}, último mês da base ({resumo_precos['defasagem_meses']} mês(es) de defasagem).")
+            if resumo_precos['volatilidade'] is not None:
+                st.caption(f"Volatilidade anualizada do índice (12m): {resumo_precos['volatilidade']:.2f}%")
+
+        indice_comparaveis = carregar_indice_comparaveis()
+        st.text_input("Endereço do Imóvel (logradouro, número, bairro):", key='endereco_imovel')
+        c1, c2 = st.columns([1, 2])
+        with c1:
+            st.number_input("Raio de Busca de Comparáveis (km):", min_value=0.1, max_value=50.0, step=0.5, key='raio_comparaveis_km')
+        with c2:
+            st.button("Sugerir Comparáveis e Risco de Oferta (Base Local)", use_container_width=True,
+                      on_click=callback_sugerir_comparaveis,
+                      disabled=indice_comparaveis is None or not st.session_state.endereco_imovel.strip(),
+                      help="Requer o endereço do imóvel e a base de imóveis de referência em dados/comparaveis.csv (colunas lat, lon e, opcionalmente, valor, tipo_imovel, ano_lancamento).")
+        resumo = st.session_state.get('resumo_comparaveis')
+        if resumo and 'erro' in resumo:
+            st.warning(resumo['erro'])
+        elif resumo:
+            texto = f"{resumo['qtd']} comparáveis no raio"
+            if resumo['distancia_mediana_km'] is not None: texto += f" | distância mediana: {resumo['distancia_mediana_km']:.2f} km"
+            if resumo['valor_mediano'] is not None: texto += f" | valor mediano: R$ {resumo['valor_mediano']:,.2f}"
+            st.caption(texto)
 
     with st.expander("Subfator 2: Características Físicas e Adequação (Peso 25%)"):
         c1, c2, c3 = st.columns(3)
@@ -652,7 +677,7 @@ with tab1:
         st.selectbox("Risco Ambiental Identificado no Imóvel:", ['Inexistente', 'Baixo/Gerenciado', 'Requer análise'], key='risco_ambiental_imovel')
 
     if st.button("Calcular Score Robusto do Pilar 1", use_container_width=True):
-        st.session_state.scores['pilar1'] = calcular_score_pilar1_lastro_robusto()
+        st.session_state.scores['pilar1'] = calcular_score_pilar1(st.session_state)
         st.session_state.map_data = get_coords(st.session_state.cidade_mapa)
         st.plotly_chart(create_gauge_chart(st.session_state.scores['pilar1'], "Score Ponderado (Pilar 1)"), use_container_width=True)
     if st.session_state.get('map_data') is not None:
@@ -661,8 +686,7 @@ with tab1:
     st.divider()
     st.subheader("🤖 Análise com IA Gemini")
     if st.button("Gerar Análise Qualitativa para o Pilar 1", use_container_width=True, on_click=callback_gerar_analise_p1): pass
-    if "analise_p1" in st.session_state:
-        with st.container(border=True): st.markdown(st.session_state.analise_p1)
+    exibir_analise_ia('analise_p1', callback_gerar_analise_p1)
 
 with tab2:
     st.header("Pilar II: Análise do Crédito e do Devedor (Due Diligence)")
@@ -717,14 +741,13 @@ with tab2:
             with c3: st.number_input("Inadimplência Atual > 90d (%)", key='inadimplencia_90d')
 
     if st.button("Calcular Score Robusto do Pilar 2", use_container_width=True):
-        st.session_state.scores['pilar2'] = calcular_score_pilar2_credito_robusto()
+        st.session_state.scores['pilar2'] = calcular_score_pilar2(st.session_state)
         st.plotly_chart(create_gauge_chart(st.session_state.scores['pilar2'], "Score Ponderado (Pilar 2)"), use_container_width=True)
 
     st.divider()
     st.subheader("🤖 Análise com IA Gemini")
     if st.button("Gerar Análise Qualitativa para o Pilar 2", use_container_width=True, on_click=callback_gerar_analise_p2): pass
-    if "analise_p2" in st.session_state:
-        with st.container(border=True): st.markdown(st.session_state.analise_p2)
+    exibir_analise_ia('analise_p2', callback_gerar_analise_p2)
 
 with tab3:
     st.header("Pilar III: Análise da Estrutura e Performance da CCI")
@@ -758,13 +781,12 @@ with tab3:
             st.selectbox("Histórico de Renegociação:", ['Sem histórico de renegociação', 'Renegociações pontuais e bem-sucedidas', 'Renegociações recorrentes ou com perdas'], key='historico_renegociacao')
 
     if st.button("Calcular Score Robusto do Pilar 3", use_container_width=True):
-        st.session_state.scores['pilar3'] = calcular_score_pilar3_estrutura_robusto()
+        st.session_state.scores['pilar3'] = calcular_score_pilar3(st.session_state)
         st.plotly_chart(create_gauge_chart(st.session_state.scores['pilar3'], "Score Ponderado (Pilar 3)"), use_container_width=True)
     st.divider()
     st.subheader("🤖 Análise com IA Gemini")
     if st.button("Gerar Análise Qualitativa para o Pilar 3", use_container_width=True, on_click=callback_gerar_analise_p3): pass
-    if "analise_p3" in st.session_state:
-        with st.container(border=True): st.markdown(st.session_state.analise_p3)
+    exibir_analise_ia('analise_p3', callback_gerar_analise_p3)
 
 with tab_prec:
     st.header("Precificação Indicativa da CCI")
@@ -773,6 +795,19 @@ with tab_prec:
     else:
         st.info("A precificação abaixo é calculada somando um spread de crédito (baseado no rating e duration) a uma taxa de referência (NTN-B).")
         
+        st.button("Gerar Fluxo de Caixa e Calcular Duration", use_container_width=True, on_click=callback_gerar_fluxo,
+                  help="Projeta o fluxo (SAC/Price) com volume, taxa, prazo e data de emissão do Cadastro e preenche a duration de Macaulay.")
+        armazem = obter_armazem_fluxos()
+        if st.session_state.get('fluxo_cci_id') in armazem:
+            fluxo_df = armazem.fluxo_df(st.session_state.fluxo_cci_id)
+            with st.expander(f"Fluxo de Caixa Projetado ({st.session_state.get('fluxo_cci_op', '')})"):
+                fig_fluxo = go.Figure()
+                fig_fluxo.add_trace(go.Bar(x=fluxo_df['mes'], y=fluxo_df['juros'], name='Juros'))
+                fig_fluxo.add_trace(go.Bar(x=fluxo_df['mes'], y=fluxo_df['amortizacao'], name='Amortização'))
+                fig_fluxo.update_layout(barmode='stack', height=300, margin={'t': 20, 'b': 20, 'l': 20, 'r': 20})
+                st.plotly_chart(fig_fluxo, use_container_width=True)
+                st.dataframe(fluxo_df, use_container_width=True, hide_index=True)
+
         st.subheader("Parâmetros de Mercado e Resultado")
         c1, c2, c3 = st.columns(3)
         with c1:
@@ -782,31 +817,23 @@ with tab_prec:
         with c3:
             cdi_proj_input = st.number_input("Projeção de CDI Anual (%)", key='precificacao_cdi_proj', step=0.1)
 
-        pesos = {'pilar1': 0.30, 'pilar2': 0.40, 'pilar3': 0.30}
-        rating_final_calc = ajustar_rating(converter_score_para_rating(sum(st.session_state.scores.get(p, 1) * pesos[p] for p in pesos.keys())), st.session_state.ajuste_final)
-        spread_cci = calcular_spread_credito(rating_final_calc, duration_manual, st.session_state.op_volume)
-        
-        taxa_ntnb_dec = taxa_ntnb_input / 100
-        cdi_proj_dec = cdi_proj_input / 100
-        inflacao_implicita = ((1 + cdi_proj_dec) / (1 + taxa_ntnb_dec)) - 1 if taxa_ntnb_dec > -1 else 0
-        
-        taxa_real_cci = taxa_ntnb_dec + (spread_cci / 100)
-        taxa_nominal_cci = (1 + taxa_real_cci) * (1 + inflacao_implicita) - 1
-        spread_cdi_cci = (taxa_nominal_cci - cdi_proj_dec) * 100
+        rating_final_calc = ajustar_rating(converter_score_para_rating(calcular_score_final(st.session_state.scores)), st.session_state.ajuste_final)
+        spread_cci = calcular_spread_credito(rating_final_calc, duration_manual, st.session_state.op_volume, st.session_state.finalidade_credito)
+        taxa_ipca_cci, spread_cdi_cci = calcular_taxas_indicativas(spread_cci, taxa_ntnb_input, cdi_proj_input)
 
         with st.container(border=True):
             st.markdown(f"<h5>Precificação Indicativa ({rating_final_calc})</h5>", unsafe_allow_html=True)
             st.metric("Spread de Crédito sobre NTN-B", f"{spread_cci:.2f}%")
-            st.success(f"**Taxa Indicativa (IPCA): IPCA + {taxa_ntnb_input + spread_cci:.2f}% a.a.**")
-            st.info(f"**Taxa Indicativa (CDI): CDI + {spread_cdi_cci:.2f}% a.a.**")
+            st.success(f"**Taxa Indicativa (IPCA): IPCA + {float(taxa_ipca_cci):.2f}% a.a.**")
+            st.info(f"**Taxa Indicativa (CDI): CDI + {float(spread_cdi_cci):.2f}% a.a.**")
 
 with tab_res:
     st.header("Resultado Final e Atribuição de Rating")
     if len(st.session_state.scores) < 3:
         st.warning("Calcule todos os 3 pilares de score antes de prosseguir.")
     else:
-        pesos = {'pilar1': 0.30, 'pilar2': 0.40, 'pilar3': 0.30}
-        score_final_ponderado = sum(st.session_state.scores.get(p, 1) * pesos[p] for p in pesos)
+        pesos = PESOS_PILARES
+        score_final_ponderado = calcular_score_final(st.session_state.scores)
         rating_indicado = converter_score_para_rating(score_final_ponderado)
 
         st.subheader("Scorecard Mestre")
@@ -832,16 +859,127 @@ with tab_res:
             st.metric("Rating Final Atribuído", value=rating_final)
         with col2:
             st.text_area("Justificativa e comentários finais:", height=150, key='justificativa_final')
+        st.button("Registrar Rating no Histórico", use_container_width=True, on_click=callback_registrar_rating,
+                  help="Grava um evento de rating (hash das entradas, pilares, ajuste, rating final e spread) no histórico da carteira.")
+        rating_registrado = st.session_state.pop('rating_registrado', None)
+        if rating_registrado: st.success("Rating registrado no histórico.")
+        elif rating_registrado is False:
+            st.error("As entradas mudaram depois do cálculo dos pilares: recalcule os 3 pilares antes de registrar o rating.")
+
+        st.divider()
+        st.subheader("📈 Histórico e Vigilância da Carteira")
+        historico = obter_historico_ratings()
+        with st.expander(f"Histórico de Ratings da Operação {st.session_state.op_codigo}"):
+            eventos_op = historico.historico_operacao(st.session_state.op_codigo)
+            if eventos_op.empty:
+                st.info("Nenhum evento registrado para esta operação.")
+            else:
+                fig_hist = go.Figure(go.Scatter(x=eventos_op['data'], y=eventos_op['score_final'], mode='lines+markers',
+                                                text=eventos_op['rating_final'], name='Score Final'))
+                fig_hist.update_layout(height=250, margin={'t': 20, 'b': 20, 'l': 20, 'r': 20}, yaxis_range=[1, 5])
+                st.plotly_chart(fig_hist, use_container_width=True)
+                st.dataframe(eventos_op.drop(columns=['op_id']), use_container_width=True, hide_index=True)
+
+        with st.expander("Evolução e Migração de Ratings da Carteira"):
+            serie = historico.serie_temporal()
+            if serie.empty:
+                st.info("O histórico ainda não possui eventos.")
+            else:
+                colunas_rating = [c for c in serie.columns if c.startswith('br')]
+                fig_serie = go.Figure([go.Bar(x=serie.index, y=serie[r], name=r) for r in colunas_rating])
+                fig_serie.update_layout(barmode='stack', height=300, margin={'t': 20, 'b': 20, 'l': 20, 'r': 20})
+                st.plotly_chart(fig_serie, use_container_width=True)
+                st.dataframe(serie[['operacoes', 'eventos', 'exposicao', 'score_medio', 'spread_medio', 'upgrades', 'downgrades']],
+                             use_container_width=True)
+
+                meses = list(serie.index)
+                m1, m2 = st.columns(2)
+                mes_inicial = m1.selectbox("Mês inicial", meses, index=max(0, len(meses) - 13), key='historico_mes_inicial')
+                mes_final = m2.selectbox("Mês final", meses, index=len(meses) - 1, key='historico_mes_final')
+                ponderar = st.toggle("Ponderar pela exposição", key='historico_ponderar_exposicao')
+                st.dataframe(historico.matriz_migracao(mes_inicial, mes_final, ponderar), use_container_width=True)
 
         st.divider()
         st.subheader("⬇️ Download do Relatório")
-        pdf_data = gerar_relatorio_pdf(st.session_state)
+        # O PDF só é gerado quando muda algum dado que ele exibe; fica no armazém compartilhado, não na sessão
+        chave_pdf = chave_conteudo(*[st.session_state.get(c) for c in CAMPOS_RELATORIO])
+        pdf_data = obter_armazem_artefatos().obter(chave_pdf, st.session_state.sessao_id)
+        descartadas = [r for r in CHAVES_ARTEFATOS if st.session_state.get(f'{r}_id') and obter_artefato(r) is None]
+        if pdf_data is None:
+            pdf_data = gerar_relatorio_pdf(st.session_state)
+            # Um relatório sem alguma análise descartada não pode ficar guardado sob a chave do relatório completo
+            if pdf_data and not descartadas: guardar_artefato('relatorio_pdf', pdf_data, chave_pdf)
+            if descartadas: st.warning("O relatório não inclui as análises de IA descartadas da memória; gere-as novamente nas abas dos pilares.")
         st.download_button(
             label="Baixar Relatório em PDF", data=pdf_data,
             file_name=f"Relatorio_CCI_{st.session_state.op_nome.replace(' ', '_')}.pdf",
             mime="application/pdf", use_container_width=True
         )
 
+with tab_cart:
+    st.header("Área de Trabalho da Carteira")
+    st.markdown("Avalie um arquivo com muitas operações (uma por linha, com os mesmos campos da análise individual) e navegue pelos resultados. "
+                "Colunas opcionais `lat` e `lon` da garantia habilitam a análise de concentração regional.")
+    arquivo_carteira = st.file_uploader("Arquivo de operações (.jsonl ou .csv)", type=['jsonl', 'csv'])
+    st.checkbox("Preencher FipeZAP e liquidez ausentes pela base local de índices", key='carteira_preencher_indices',
+                disabled=carregar_base_indices_precos() is None)
+    if st.button("Avaliar Carteira", disabled=arquivo_carteira is None, use_container_width=True):
+        try:
+            processar_carteira(arquivo_carteira, st.session_state.get('carteira_preencher_indices', False))
+        except Exception as e:
+            st.error(f"Erro ao avaliar a carteira: {e}")
+
+    area = obter_area_carteiras()
+    chave_carteira = st.session_state.get('carteira_chave')
+    if chave_carteira not in area:
+        st.info("Nenhuma carteira avaliada nesta sessão.")
+    else:
+        carteira = area.obter(chave_carteira)
+        resumo = carteira['resumo']
+        if resumo['recusadas']:
+            st.error(f"{resumo['recusadas']:,} operações com erros de preenchimento não foram avaliadas nem entram na perda da carteira.")
+            with st.expander("Operações recusadas"):
+                st.dataframe(carteira['recusadas'].head(1000), use_container_width=True, hide_index=True)
+                if resumo['recusadas'] > 1000: st.caption("Exibindo as primeiras 1.000 operações recusadas.")
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("Operações", f"{resumo['operacoes']:,}")
+        c2.metric("Exposição Total", f"R$ {resumo['exposicao']:,.0f}")
+        c3.metric("Score Médio", f"{resumo['score_medio']:.2f}" if resumo['score_medio'] is not None else "N/A")
+        if resumo['perda']:
+            c4.metric(f"Perda Esperada | ES {resumo['perda']['confianca']:.0%}",
+                      f"R$ {resumo['perda']['perda_esperada']:,.0f}", f"ES R$ {resumo['perda']['es']:,.0f}", delta_color='off')
+        fig_dist = go.Figure(go.Bar(x=resumo['distribuicao'].index, y=resumo['distribuicao'].values))
+        fig_dist.update_layout(height=250, margin={'t': 20, 'b': 20, 'l': 20, 'r': 20})
+        st.plotly_chart(fig_dist, use_container_width=True)
+        concentracao = resumo.get('concentracao')
+        if concentracao is not None:
+            with st.expander("Concentração Regional das Garantias (geohash)"):
+                c1, c2 = st.columns([1, 2])
+                c1.metric("HHI por região", f"{concentracao.attrs['hhi']:.3f}")
+                c1.metric("Regiões", f"{len(concentracao):,}")
+                c2.dataframe(concentracao.head(20).style.format({'exposicao': "R$ {:,.0f}", 'participacao': "{:.1%}", 'lat': "{:.4f}", 'lon': "{:.4f}"}),
+                             use_container_width=True)
+                st.map(concentracao[['lat', 'lon']], zoom=4)
+
+        st.subheader("Resultados")
+        f1, f2, f3 = st.columns([2, 2, 1])
+        ratings_filtro = f1.multiselect("Rating final", list(resumo['distribuicao'].index), key='carteira_filtro_ratings')
+        busca = f2.text_input("Buscar por código ou nome", key='carteira_busca')
+        faixa_score = f3.slider("Score final", 1.0, 5.0, (1.0, 5.0), step=0.05, key='carteira_faixa_score')
+        o1, o2, o3 = st.columns([2, 1, 1])
+        ordenar_por = o1.selectbox("Ordenar por", ['score_final', 'rating_final', 'spread_credito', 'saldo_devedor_credito', 'op_codigo'],
+                                   key='carteira_ordenar_por')
+        decrescente = o2.toggle("Decrescente", key='carteira_decrescente')
+        tamanho_pagina = o3.selectbox("Linhas por página", [25, 50, 100, 250], index=1, key='carteira_tamanho_pagina')
+
+        posicoes = area.consultar(chave_carteira, tuple(ratings_filtro), busca.strip(), *faixa_score, ordenar_por, decrescente)
+        n_paginas = max(1, -(-len(posicoes) // tamanho_pagina))
+        if st.session_state.get('carteira_pagina', 1) > n_paginas: st.session_state.carteira_pagina = n_paginas
+        pagina = st.number_input(f"Página (de {n_paginas})", min_value=1, max_value=n_paginas, step=1, key='carteira_pagina')
+        st.caption(f"{len(posicoes):,} operações encontradas")
+        st.dataframe(area.pagina(chave_carteira, posicoes, pagina, tamanho_pagina),
+                     use_container_width=True, hide_index=True)
+
 with tab_met:
     st.header("Metodologia de Rating para CCI")
     st.markdown("Esta metodologia foi desenvolvida para a análise e atribuição de rating a Cédulas de Crédito Imobiliário (CCI).")
@@ -853,6 +991,11 @@ with tab_met:
     - **Pilar III: Análise da Estrutura e Performance da CCI (Peso: 30%)**
     """)
 
+    tabelas_metodologia = obter_tabelas_metodologia()
+    c1, c2 = st.columns([1, 2])
+    c1.dataframe(tabelas_metodologia['pesos'], use_container_width=True, hide_index=True)
+    c2.dataframe(tabelas_metodologia['faixas'], use_container_width=True, hide_index=True)
+
     with st.expander("Pilar I: Risco do Lastro Imobiliário (Peso: 30%)"):
         st.markdown("Avalia a qualidade e a liquidez da garantia real através de uma due diligence aprofundada, dividida em subfatores ponderados: Avaliação e Localização (50%), Características Físicas (25%) e Due Diligence Legal (25%).")
 
@@ -867,3 +1010,12 @@ with tab_met:
         - **Análise Estrutural (Peso 30% para ops com histórico):** Avalia a qualidade dos prestadores de serviço (Emissor, Servicer) e a governança da operação.
         - **Análise de Performance (Peso 70% para ops com histórico):** Módulo de vigilância que mede a saúde real do crédito através de um **Aging de Inadimplência** detalhado, indicadores dinâmicos como **Taxa de Cura** e **Roll Rate**, e o histórico de renegociações. Para operações novas, a Análise Estrutural tem maior peso (80%).
         """)
+
+# --- USO DE MEMÓRIA (ao final, para refletir toda a execução) ---
+with st.sidebar.expander("Uso de Memória da Sessão"):
+    armazem_artefatos = obter_armazem_artefatos()
+    relatorio = relatorio_memoria(st.session_state.to_dict(), armazem_artefatos, st.session_state.sessao_id)
+    st.metric("Total da Sessão", f"{relatorio['bytes'].sum() / 1024:,.1f} KB")
+    st.dataframe(relatorio.head(15), use_container_width=True, hide_index=True)
+    st.caption(f"Artefatos compartilhados no processo: {armazem_artefatos.uso() / 1024:,.1f} KB "
+               f"(limite por sessão: {armazem_artefatos.limite_por_sessao / 1024 ** 2:.0f} MB)")
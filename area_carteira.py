@@ -0,0 +1,187 @@
+# area_carteira.py
+# Área de trabalho de carteiras: leitura e avaliação em blocos de arquivos grandes de operações.
+# Os resultados ficam no servidor, indexados pelo hash do arquivo, e são consultados por
+# filtros e páginas, de modo que a interface só recebe as linhas exibidas.
+import ast
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from indice_espacial import IndiceEspacial
+from motor_rating import CAMPOS_LISTA, CAMPOS_PRECIFICACAO, ESCALA_RATING, TODOS_CAMPOS, avaliar_lote, validar_operacao
+from perda_carteira import parametros_exposicoes, perda_analitica
+
+TAMANHO_BLOCO = 5000
+MAX_CARTEIRAS = 8
+COLUNAS_CADASTRO = ['op_codigo', 'op_nome', 'op_emissor', 'tipo_devedor', 'cidade_mapa', 'lat', 'lon', 'saldo_devedor_credito', 'ltv_operacao']
+COLUNAS_RESULTADO = ['pilar1', 'pilar2', 'pilar3', 'score_final', 'rating_indicado', 'rating_final', 'spread_credito', 'taxa_ipca', 'spread_cdi']
+COLUNAS_CATEGORICAS = ['op_emissor', 'tipo_devedor', 'cidade_mapa', 'rating_indicado', 'rating_final']
+COLUNAS_PERDA = ['saldo_devedor_credito', 'valor_avaliacao_imovel', 'estresse_valor_perc']
+CAMPOS_VALIDADOS = set(TODOS_CAMPOS) | set(CAMPOS_PRECIFICACAO)
+PRECISAO_CONCENTRACAO = 4  # geohash de 4 caracteres: células de ~39 km x 20 km
+
+# ==============================================================================
+# LEITURA E AVALIAÇÃO EM BLOCOS
+# ==============================================================================
+
+def chave_arquivo(conteudo):
+    return hashlib.sha1(conteudo).hexdigest()
+
+def contar_operacoes(conteudo, nome):
+    """Número de operações do arquivo (linhas não vazias, sem o cabeçalho do CSV), para a barra de progresso."""
+    linhas = conteudo.count(b'\n') + (0 if conteudo.endswith(b'\n') else 1)
+    return max(0, linhas - (1 if nome.endswith('.csv') else 0))
+
+def ler_lista(valor):
+    """Campo-lista lido de um CSV ("['a', 'b']", como gravado pelo pandas, ou "a; b").
+
+    Textos que não formam uma lista são devolvidos como estão e recusados por `validar_operacao`.
+    """
+    texto = valor.strip()
+    if not texto: return []
+    if texto.startswith('['):
+        try:
+            itens = ast.literal_eval(texto)
+        except (ValueError, SyntaxError):
+            return valor
+        return [str(item) for item in itens] if isinstance(itens, (list, tuple)) else valor
+    return [item.strip() for item in texto.split(';') if item.strip()]
+
+def ler_em_blocos(conteudo, nome, tamanho_bloco=TAMANHO_BLOCO):
+    """Gera DataFrames de até `tamanho_bloco` operações a partir de um CSV ou JSONL (uma operação por linha)."""
+    if nome.endswith('.jsonl'):
+        leitor = pd.read_json(io.BytesIO(conteudo), lines=True, chunksize=tamanho_bloco)
+    elif nome.endswith('.csv'):
+        leitor = pd.read_csv(io.BytesIO(conteudo), chunksize=tamanho_bloco, converters={c: ler_lista for c in CAMPOS_LISTA})
+    else:
+        raise ValueError(f"Formato não suportado: {nome} (use .csv ou .jsonl)")
+    with leitor:
+        yield from leitor
+
+def validar_bloco(bloco):
+    """Erros de preenchimento de cada operação do bloco (Series de listas; vazias nas operações válidas)."""
+    colunas = [c for c in bloco.columns if c in CAMPOS_VALIDADOS]
+    valores = []
+    for coluna in colunas:
+        valor = bloco[coluna].to_numpy(dtype=object)
+        valores.append(np.where(pd.isna(valor), None, valor))
+    registros = [dict(zip(colunas, linha)) for linha in zip(*valores)] if colunas else [{} for _ in range(len(bloco))]
+    return pd.Series([validar_operacao(r) for r in registros], index=bloco.index, dtype=object)
+
+def primeira_linha_dados(nome):
+    """Linha do arquivo (a partir de 1) da primeira operação: o CSV tem a linha de cabeçalho antes."""
+    return 2 if nome.endswith('.csv') else 1
+
+def avaliar_em_blocos(blocos, preparar=None, linha_inicial=1):
+    """Avalia cada bloco e gera (cadastro + resultado, exposições para a perda ou None, operações recusadas, operações processadas).
+
+    Operações com erros de preenchimento não são avaliadas nem entram na perda; são devolvidas
+    com a linha do arquivo (a da primeira operação é `linha_inicial`; ver `primeira_linha_dados`) e os erros.
+    """
+    processadas = 0
+    for bloco in blocos:
+        if preparar: bloco = preparar(bloco)
+        erros = validar_bloco(bloco)
+        invalidas = erros.str.len() > 0
+        recusadas = pd.DataFrame({
+            'linha': linha_inicial + processadas + np.flatnonzero(invalidas.to_numpy()),
+            'op_codigo': bloco.loc[invalidas, 'op_codigo'].astype(str) if 'op_codigo' in bloco.columns else None,
+            'erros': erros[invalidas].str.join('; '),
+        })
+        processadas += len(bloco)
+        bloco = bloco[~invalidas]
+        resultado = avaliar_lote(bloco)
+        exposicoes = None
+        if all(c in bloco.columns for c in COLUNAS_PERDA):
+            exposicoes = parametros_exposicoes(bloco.assign(rating_final=resultado['rating_final']))
+        yield (pd.concat([bloco.reindex(columns=COLUNAS_CADASTRO), resultado[COLUNAS_RESULTADO]], axis=1), exposicoes,
+               recusadas.reset_index(drop=True), processadas)
+
+def consolidar_carteira(partes, exposicoes=None, recusadas=None):
+    """Junta os blocos avaliados em um único DataFrame compacto (categorias) e calcula o resumo da carteira."""
+    resultados = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame(columns=COLUNAS_CADASTRO + COLUNAS_RESULTADO)
+    recusadas = pd.concat(recusadas, ignore_index=True) if recusadas else pd.DataFrame(columns=['linha', 'op_codigo', 'erros'])
+    for coluna in COLUNAS_CATEGORICAS:
+        resultados[coluna] = resultados[coluna].astype('category')
+    resultados['op_codigo'] = resultados['op_codigo'].astype(str)
+
+    saldo = pd.to_numeric(resultados['saldo_devedor_credito'], errors='coerce')
+    resumo = {
+        'operacoes': len(resultados),
+        'recusadas': len(recusadas),
+        'exposicao': float(saldo.sum()),
+        'score_medio': float(resultados['score_final'].mean()) if len(resultados) else None,
+        'distribuicao': resultados['rating_final'].value_counts().reindex(list(reversed(ESCALA_RATING)), fill_value=0),
+        'perda': None,
+        'concentracao': None,
+    }
+    georreferenciadas = resultados[['lat', 'lon']].apply(pd.to_numeric, errors='coerce').assign(saldo=saldo.fillna(0.0))
+    if georreferenciadas[['lat', 'lon']].notna().all(axis=1).any():
+        indice = IndiceEspacial(georreferenciadas, precisao_geohash=PRECISAO_CONCENTRACAO)
+        resumo['concentracao'] = indice.concentracao_regional('saldo')
+    exposicoes = [e for e in (exposicoes or []) if e is not None]
+    if exposicoes and len(exposicoes) == len(partes):
+        perda = perda_analitica(pd.concat(exposicoes))
+        resumo['perda'] = {chave: perda[chave] for chave in ('perda_esperada', 'var', 'es', 'confianca')}
+    return {'resultados': resultados, 'recusadas': recusadas, 'resumo': resumo}
+
+# ==============================================================================
+# RESULTADOS COMPARTILHADOS
+# ==============================================================================
+
+class AreaCarteiras:
+    """Carteiras avaliadas, por chave, compartilhadas entre as sessões; mantém as `max_carteiras` mais recentes.
+
+    As consultas (filtro + ordenação) devolvem apenas as posições das linhas e ficam em cache,
+    então trocar de página não refaz o filtro nem copia o DataFrame inteiro.
+    """
+
+    def __init__(self, max_carteiras=MAX_CARTEIRAS):
+        self.max_carteiras = max_carteiras
+        self._carteiras = OrderedDict()
+        self._trava = threading.Lock()
+        self.consultar = lru_cache(maxsize=256)(self._consultar)
+
+    def __contains__(self, chave):
+        return chave in self._carteiras
+
+    def guardar(self, chave, carteira):
+        with self._trava:
+            self._carteiras[chave] = carteira
+            self._carteiras.move_to_end(chave)
+            while len(self._carteiras) > self.max_carteiras:
+                self._carteiras.popitem(last=False)
+                self.consultar.cache_clear()
+
+    def obter(self, chave):
+        with self._trava:
+            self._carteiras.move_to_end(chave)
+            return self._carteiras[chave]
+
+    def _consultar(self, chave, ratings=(), busca='', score_min=1.0, score_max=5.0, ordenar_por=None, decrescente=False):
+        """Posições (np.ndarray) das operações que atendem aos filtros, na ordem pedida."""
+        df = self.obter(chave)['resultados']
+        mascara = df['score_final'].between(score_min, score_max).to_numpy()
+        if ratings:
+            mascara = mascara & df['rating_final'].isin(ratings).to_numpy()
+        if busca:
+            texto = df['op_codigo'] + ' ' + df['op_nome'].astype(str)
+            mascara = mascara & texto.str.contains(busca, case=False, regex=False).to_numpy()
+        posicoes = np.flatnonzero(mascara)
+        if ordenar_por:
+            coluna = df[ordenar_por].iloc[posicoes]
+            if coluna.name in ('rating_indicado', 'rating_final'):
+                coluna = coluna.astype(str).map({r: i for i, r in enumerate(ESCALA_RATING)})
+            ordem = np.argsort(coluna.to_numpy(), kind='stable')
+            posicoes = posicoes[ordem[::-1] if decrescente else ordem]
+        return posicoes
+
+    def pagina(self, chave, posicoes, numero, tamanho):
+        """Linhas da página `numero` (a partir de 1) das posições consultadas."""
+        inicio = (numero - 1) * tamanho
+        return self.obter(chave)['resultados'].iloc[posicoes[inicio:inicio + tamanho]]
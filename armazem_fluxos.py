@@ -0,0 +1,189 @@
+# armazem_fluxos.py
+# Armazém colunar, mapeado em memória, para os fluxos de caixa das CCIs da carteira.
+# Cada campo é um arquivo binário de tipo fixo com os fluxos de todas as operações
+# concatenados; um índice (id, início, tamanho) localiza o fluxo de cada operação.
+# A escrita é só por acréscimo, e vários processos podem ler os mesmos arquivos
+# simultaneamente compartilhando o cache de páginas do sistema operacional.
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from trava_arquivo import trava_exclusiva
+
+CAMPOS_FLUXO = {
+    'mes': np.int32,  # ano * 12 + mês - 1
+    'saldo_inicial': np.float64,
+    'juros': np.float64,
+    'amortizacao': np.float64,
+    'parcela': np.float64,
+    'saldo_final': np.float64,
+}
+TAMANHO_ID = 32
+DTYPE_INDICE = np.dtype([('id', f'S{TAMANHO_ID}'), ('inicio', '<i8'), ('tamanho', '<i8')])
+
+class ArmazemFluxos:
+    """Leitura (cópia zero) e escrita por acréscimo de fluxos de caixa por operação.
+
+    Protocolo de escrita: os dados de todos os campos são gravados e sincronizados em disco
+    antes do registro no índice. Um leitor só enxerga operações cujo registro de índice está
+    completo, portanto nunca lê um fluxo pela metade. Um novo fluxo para uma operação já
+    existente substitui o anterior (vale o último registro).
+    """
+
+    def __init__(self, diretorio, campos=None):
+        self.diretorio = diretorio
+        os.makedirs(diretorio, exist_ok=True)
+        caminho_esquema = os.path.join(diretorio, 'esquema.json')
+        if os.path.exists(caminho_esquema):
+            with open(caminho_esquema) as f:
+                self.campos = {nome: np.dtype(tipo) for nome, tipo in json.load(f).items()}
+        else:
+            self.campos = {nome: np.dtype(tipo) for nome, tipo in (campos or CAMPOS_FLUXO).items()}
+            with open(caminho_esquema, 'w') as f:
+                json.dump({nome: tipo.str for nome, tipo in self.campos.items()}, f)
+        self._mapas = {}
+        self._posicoes = {}
+        self._registros_lidos = 0
+        self.indice = np.empty(0, dtype=DTYPE_INDICE)
+
+    def _caminho(self, nome):
+        return os.path.join(self.diretorio, f'{nome}.bin')
+
+    def _mapear(self, caminho, dtype, n_itens):
+        if n_itens == 0: return np.empty(0, dtype=dtype)
+        return np.memmap(caminho, dtype=dtype, mode='r', shape=(n_itens,))
+
+    # ==========================================================================
+    # LEITURA
+    # ==========================================================================
+
+    def atualizar(self):
+        """Reabre os mapas se outro processo acrescentou fluxos desde a última leitura."""
+        caminho_indice = self._caminho('indice')
+        n_registros = os.path.getsize(caminho_indice) // DTYPE_INDICE.itemsize if os.path.exists(caminho_indice) else 0
+        if n_registros == self._registros_lidos and self._mapas: return
+        self.indice = self._mapear(caminho_indice, DTYPE_INDICE, n_registros)
+        for i in range(self._registros_lidos, n_registros):
+            self._posicoes[self.indice['id'][i].decode()] = i
+        self._registros_lidos = n_registros
+
+        n_itens = int(self.indice['inicio'][-1] + self.indice['tamanho'][-1]) if n_registros else 0
+        self._mapas = {nome: self._mapear(self._caminho(nome), tipo, n_itens) for nome, tipo in self.campos.items()}
+
+    def __contains__(self, op_id):
+        self.atualizar()
+        return str(op_id) in self._posicoes
+
+    def __len__(self):
+        self.atualizar()
+        return len(self._posicoes)
+
+    def ids(self):
+        self.atualizar()
+        return list(self._posicoes)
+
+    def fluxo(self, op_id):
+        """Fluxo de uma operação como dict de visões (sem cópia) sobre os arquivos mapeados."""
+        self.atualizar()
+        registro = self.indice[self._posicoes[str(op_id)]]
+        inicio, fim = int(registro['inicio']), int(registro['inicio'] + registro['tamanho'])
+        return {nome: mapa[inicio:fim] for nome, mapa in self._mapas.items()}
+
+    def fluxo_df(self, op_id):
+        """Fluxo de uma operação como DataFrame, para exibição (datas como primeiro dia do mês)."""
+        fluxo = self.fluxo(op_id)
+        df = pd.DataFrame(fluxo, copy=False)
+        if 'mes' in df.columns:
+            df['mes'] = pd.to_datetime({'year': fluxo['mes'] // 12, 'month': fluxo['mes'] % 12 + 1, 'day': 1})
+        return df
+
+    def registros_vigentes(self):
+        """Posições no índice do registro vigente de cada operação (o último gravado)."""
+        self.atualizar()
+        return np.fromiter(self._posicoes.values(), dtype=np.int64, count=len(self._posicoes))
+
+    def coluna(self, nome):
+        """Coluna inteira (todas as operações, inclusive fluxos substituídos), mapeada sem cópia."""
+        self.atualizar()
+        return self._mapas[nome]
+
+    # ==========================================================================
+    # ESCRITA
+    # ==========================================================================
+
+    def adicionar(self, op_id, fluxo):
+        self.adicionar_lote([(op_id, fluxo)])
+
+    def adicionar_lote(self, fluxos):
+        """Acrescenta vários fluxos [(op_id, {campo: array})] com uma única trava e sincronização."""
+        if not fluxos: return
+        with trava_exclusiva(self._caminho('.trava')):
+            caminho_indice = self._caminho('indice')
+            n_registros = os.path.getsize(caminho_indice) // DTYPE_INDICE.itemsize if os.path.exists(caminho_indice) else 0
+            if n_registros:
+                ultimo = np.fromfile(caminho_indice, dtype=DTYPE_INDICE, count=1, offset=(n_registros - 1) * DTYPE_INDICE.itemsize)[0]
+                inicio = int(ultimo['inicio'] + ultimo['tamanho'])
+            else:
+                inicio = 0
+
+            inicio_dados = inicio
+            registros = np.empty(len(fluxos), dtype=DTYPE_INDICE)
+            for i, (op_id, fluxo) in enumerate(fluxos):
+                chave = str(op_id).encode()
+                if len(chave) > TAMANHO_ID:
+                    raise ValueError(f"Identificador com mais de {TAMANHO_ID} bytes: {op_id}")
+                tamanhos = {len(fluxo[nome]) for nome in self.campos}
+                if len(tamanhos) != 1:
+                    raise ValueError(f"Campos do fluxo de {op_id} com tamanhos diferentes.")
+                registros[i] = (chave, inicio, tamanhos.pop())
+                inicio += int(registros[i]['tamanho'])
+
+            for nome, tipo in self.campos.items():
+                self._acrescentar(self._caminho(nome), inicio_dados,
+                                  np.concatenate([np.asarray(fluxo[nome], dtype=tipo) for _, fluxo in fluxos]))
+            self._acrescentar(caminho_indice, n_registros * DTYPE_INDICE.itemsize, registros, em_bytes=True)
+
+    @staticmethod
+    def _acrescentar(caminho, posicao, dados, em_bytes=False):
+        # Grava a partir da posição confirmada: restos de uma escrita interrompida são sobrescritos
+        with open(caminho, 'r+b' if os.path.exists(caminho) else 'wb') as f:
+            f.seek(posicao if em_bytes else posicao * dados.dtype.itemsize)
+            f.write(dados.tobytes())
+            f.truncate()
+            f.flush()
+            os.fsync(f.fileno())
+
+# ==============================================================================
+# CÁLCULOS SOBRE A CARTEIRA
+# ==============================================================================
+
+def calcular_durations(armazem, taxas_aa):
+    """Duration de Macaulay (anos) de todas as operações vigentes, vetorizada sobre as colunas mapeadas.
+
+    `taxas_aa` é um escalar ou um dict {op_id: taxa % a.a.}. Retorna uma Series indexada por op_id.
+    """
+    posicoes = armazem.registros_vigentes()
+    ids = armazem.ids()
+    registros = armazem.indice[posicoes]
+    if not len(registros): return pd.Series(dtype=float)
+    taxas = np.array([taxas_aa[i] for i in ids], dtype=float) if isinstance(taxas_aa, dict) else np.full(len(ids), float(taxas_aa))
+
+    tamanhos = registros['tamanho'].astype(np.int64)
+    # Posição de cada parcela dentro do seu fluxo (1, 2, ..., n), sem laço por operação
+    inicios_relativos = np.repeat(np.cumsum(tamanhos) - tamanhos, tamanhos)
+    deslocamentos = np.arange(tamanhos.sum()) - inicios_relativos
+    anos = (deslocamentos + 1) / 12
+    if len(posicoes) == len(armazem.indice):
+        parcelas = armazem.coluna('parcela')  # nenhum fluxo substituído: a coluna inteira, sem cópia
+    else:
+        parcelas = armazem.coluna('parcela')[np.repeat(registros['inicio'], tamanhos) + deslocamentos]
+
+    valor_presente = parcelas * (1 + np.repeat(taxas, tamanhos) / 100) ** (-anos)
+    total, ponderado = np.zeros(len(ids)), np.zeros(len(ids))
+    com_fluxo = tamanhos > 0
+    cortes = (np.cumsum(tamanhos) - tamanhos)[com_fluxo]
+    total[com_fluxo] = np.add.reduceat(valor_presente, cortes)
+    ponderado[com_fluxo] = np.add.reduceat(anos * valor_presente, cortes)
+    return pd.Series(np.where(total > 0, ponderado / np.where(total > 0, total, 1), 0.0), index=ids)
@@ -0,0 +1,131 @@
+# benchmark_api.py
+# Medição de vazão do serviço de rating (servidor_api.py): vários processos clientes, cada um
+# com várias conexões keep-alive, enviam operações sintéticas válidas para /v1/rating durante
+# um tempo fixo; ao final são impressos requisições/s, latência vista pelo cliente e as
+# métricas do próprio servidor (tamanho médio dos micro-lotes).
+#
+# Uso: python benchmark_api.py --iniciar-servidor --processos 2 --conexoes 32 --duracao 20
+import argparse
+import http.client
+import json
+import multiprocessing
+import random
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+from motor_rating import HISTORICO_NOVO, MAPAS, VALORES_PERMITIDOS
+
+FAIXAS_NUMERICAS = {
+    'estresse_valor_perc': (5, 40), 'fipezap_12m': (-5, 15), 'liquidez_dias': (30, 400),
+    'valor_avaliacao_imovel': (3e5, 5e6), 'saldo_devedor_credito': (1e5, 4e6), 'ltv_operacao': (20, 95),
+    'parcela_mensal_pf': (1e3, 5e4), 'renda_mensal_pf': (5e3, 2e5), 'dl_ebitda_pj': (0, 6), 'liq_corrente_pj': (0.5, 3),
+    'dscr_pj': (0.8, 2.5), 'num_devedores': (2, 500), 'concentracao_top5': (5, 100), 'inadimplencia_90d': (0, 10),
+    'perc_inad_30_60_dias': (0, 5), 'perc_inad_60_90_dias': (0, 5), 'perc_inad_90_180_dias': (0, 5),
+    'perc_inad_acima_180_dias': (0, 5), 'taxa_cura_mensal': (0, 60), 'roll_rate_mensal': (0, 30),
+    'precificacao_duration_manual': (0.5, 12), 'op_volume': (5e5, 5e7),
+}
+
+# ==============================================================================
+# CARGA SINTÉTICA
+# ==============================================================================
+
+def operacao_sintetica(gerador):
+    """Operação válida com valores sorteados (categorias dos mapas e faixas numéricas plausíveis)."""
+    operacao = {campo: gerador.choice(list(mapa)) for campo, mapa in MAPAS.items() if campo != 'historico_pagamento'}
+    operacao.update({campo: gerador.choice(valores) for campo, valores in VALORES_PERMITIDOS.items()})
+    operacao.update({campo: round(gerador.uniform(*faixa), 2) for campo, faixa in FAIXAS_NUMERICAS.items()})
+    operacao['historico_pagamento'] = gerador.choice(list(MAPAS['historico_pagamento']) + [HISTORICO_NOVO])
+    operacao['analise_dominial_20a'] = gerador.random() < 0.8
+    operacao['dividas_propter_rem'] = gerador.random() < 0.8
+    operacao['cnds_verificadas'] = ['CND do Imóvel (IPTU)', 'CND do Devedor'][:gerador.randint(0, 2)]
+    operacao['ajuste_final'] = gerador.randint(-1, 1)
+    return operacao
+
+# ==============================================================================
+# CLIENTES
+# ==============================================================================
+
+def _conexao(host, porta, corpos, fim, latencias, erros):
+    conexao = http.client.HTTPConnection(host, porta, timeout=30)
+    i = 0
+    while time.perf_counter() < fim:
+        inicio = time.perf_counter()
+        try:
+            conexao.request('POST', '/v1/rating', body=corpos[i % len(corpos)], headers={'Content-Type': 'application/json'})
+            resposta = conexao.getresponse()
+            resposta.read()
+            if resposta.status != 200: erros.append(resposta.status)
+        except (OSError, http.client.HTTPException) as e:
+            erros.append(type(e).__name__)
+            conexao.close()
+            conexao = http.client.HTTPConnection(host, porta, timeout=30)
+        latencias.append(time.perf_counter() - inicio)
+        i += 1
+    conexao.close()
+
+def _processo_cliente(host, porta, conexoes, duracao, semente, fila):
+    gerador = random.Random(semente)
+    corpos = [json.dumps(operacao_sintetica(gerador)).encode() for _ in range(500)]
+    fim = time.perf_counter() + duracao
+    latencias, erros = [], []
+    threads = [threading.Thread(target=_conexao, args=(host, porta, corpos, fim, latencias, erros)) for _ in range(conexoes)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    fila.put((latencias, erros))
+
+def _aguardar_servidor(host, porta, limite_s=15.0):
+    fim = time.perf_counter() + limite_s
+    while time.perf_counter() < fim:
+        try:
+            conexao = http.client.HTTPConnection(host, porta, timeout=1)
+            conexao.request('GET', '/saude')
+            if conexao.getresponse().status == 200: return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Servidor não respondeu em {host}:{porta}")
+
+def medir(host, porta, processos, conexoes, duracao):
+    """Dispara a carga e retorna o resumo (vazão, latências do cliente, erros e métricas do servidor)."""
+    fila = multiprocessing.Queue()
+    clientes = [multiprocessing.Process(target=_processo_cliente, args=(host, porta, conexoes, duracao, semente, fila))
+                for semente in range(processos)]
+    inicio = time.perf_counter()
+    for p in clientes: p.start()
+    resultados = [fila.get() for _ in clientes]
+    for p in clientes: p.join()
+    decorrido = time.perf_counter() - inicio
+
+    latencias = np.array([l for parte, _ in resultados for l in parte]) * 1000
+    erros = [e for _, parte in resultados for e in parte]
+    conexao = http.client.HTTPConnection(host, porta, timeout=5)
+    conexao.request('GET', '/v1/metricas')
+    metricas = json.loads(conexao.getresponse().read())
+    return {
+        'requisicoes': len(latencias), 'erros': len(erros), 'requisicoes_por_s': round(len(latencias) / decorrido, 1),
+        'latencia_cliente_ms': {f'p{q}': round(float(np.percentile(latencias, q)), 2) for q in (50, 95, 99)} if len(latencias) else {},
+        'servidor': metricas,
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Medição de vazão do serviço HTTP de rating')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--porta', type=int, default=8502)
+    parser.add_argument('--processos', type=int, default=2, help='Processos clientes')
+    parser.add_argument('--conexoes', type=int, default=32, help='Conexões keep-alive por processo cliente')
+    parser.add_argument('--duracao', type=float, default=20.0, help='Duração da carga, em segundos')
+    parser.add_argument('--iniciar-servidor', action='store_true', help='Sobe servidor_api.py em um subprocesso durante a medição')
+    args = parser.parse_args()
+
+    servidor = None
+    if args.iniciar_servidor:
+        servidor = subprocess.Popen([sys.executable, 'servidor_api.py', '--host', args.host, '--porta', str(args.porta)],
+                                    stdout=subprocess.DEVNULL)
+    try:
+        _aguardar_servidor(args.host, args.porta)
+        print(json.dumps(medir(args.host, args.porta, args.processos, args.conexoes, args.duracao), indent=2, ensure_ascii=False))
+    finally:
+        if servidor is not None: servidor.terminate()
@@ -0,0 +1,351 @@
+# historico_ratings.py
+# Histórico de eventos de rating da carteira, só por acréscimo e particionado por mês.
+# Cada evento guarda o hash das entradas, os scores dos pilares, o rating indicado, o ajuste,
+# o rating final e o spread. Ao lado dos eventos são mantidas a posição consolidada da carteira
+# no fim de cada mês (último evento de cada operação) e um resumo mensal pré-agregado. Matrizes
+# de migração e séries temporais leem só essas partições, sem reprocessar os eventos; o histórico
+# de uma operação é lido pelo índice de cada partição (hash da operação, início e tamanho da linha).
+#
+# Uso: python historico_ratings.py dados/historico_ratings --serie
+#      python historico_ratings.py dados/historico_ratings --migracao 2024-01 2024-12
+import argparse
+import datetime
+import glob
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from motor_rating import ESCALA_RATING, INDICE_RATING
+from rerating_incremental import calcular_impressoes, combinar_impressoes
+from trava_arquivo import trava_exclusiva
+
+CAMPOS_EVENTO = ['op_id', 'data', 'evento', 'origem', 'hash_entradas', 'pilar1', 'pilar2', 'pilar3', 'score_final',
+                 'rating_indicado', 'ajuste_final', 'rating_final', 'spread_credito', 'exposicao']
+EVENTO_RATING = 'rating'
+EVENTO_BAIXA = 'baixa'  # operação liquidada ou retirada da carteira: sai das posições seguintes
+DTYPE_INDICE_EVENTOS = np.dtype([('hash_op', '<u8'), ('inicio', '<i8'), ('tamanho', '<i8')])
+
+# ==============================================================================
+# FUNÇÕES AUXILIARES
+# ==============================================================================
+
+def chave_mes(data):
+    """'AAAA-MM' de uma data, datetime, Timestamp ou string ISO."""
+    return pd.Timestamp(data).strftime('%Y-%m')
+
+def _meses_entre(inicial, final):
+    return [p.strftime('%Y-%m') for p in pd.period_range(inicial, final, freq='M')]
+
+def _hash_ops(op_ids):
+    return pd.util.hash_array(np.array([str(op_id) for op_id in op_ids], dtype=object))
+
+def _indexar_linhas(linhas, inicio, op_ids):
+    """Registros do índice para linhas (bytes) gravadas a partir do byte `inicio`."""
+    tamanhos = np.fromiter(map(len, linhas), dtype=np.int64, count=len(linhas))
+    registros = np.empty(len(linhas), dtype=DTYPE_INDICE_EVENTOS)
+    registros['hash_op'] = _hash_ops(op_ids)
+    registros['inicio'] = inicio + np.cumsum(tamanhos) - tamanhos
+    registros['tamanho'] = tamanhos
+    return registros
+
+def _fim_indexado(registros):
+    return int(registros['inicio'][-1] + registros['tamanho'][-1]) if len(registros) else 0
+
+def hash_entradas(df):
+    """Hash hexadecimal das entradas de cada operação (mesmas impressões do re-rating incremental)."""
+    return np.char.mod('%016x', combinar_impressoes(calcular_impressoes(df)))
+
+def eventos_de_resultado(operacoes, resultado, data=None, origem='lote', coluna_id='op_codigo'):
+    """Monta os eventos de rating a partir das operações e do resultado do motor (mesmo índice)."""
+    data = pd.Timestamp(data or datetime.datetime.now()).isoformat(timespec='seconds')
+    ajuste = pd.to_numeric(operacoes['ajuste_final'], errors='coerce').fillna(0) if 'ajuste_final' in operacoes.columns else 0
+    exposicao = (pd.to_numeric(operacoes['saldo_devedor_credito'], errors='coerce')
+                 if 'saldo_devedor_credito' in operacoes.columns else np.nan)
+    eventos = pd.DataFrame({
+        'op_id': operacoes[coluna_id].astype(str).to_numpy() if coluna_id in operacoes.columns else operacoes.index.astype(str),
+        'data': data, 'evento': EVENTO_RATING, 'origem': origem, 'hash_entradas': hash_entradas(operacoes),
+        'ajuste_final': ajuste, 'exposicao': exposicao,
+    }, index=operacoes.index)
+    for campo in ('pilar1', 'pilar2', 'pilar3', 'score_final', 'rating_indicado', 'rating_final', 'spread_credito'):
+        eventos[campo] = resultado[campo]
+    return eventos[CAMPOS_EVENTO].reset_index(drop=True)
+
+# ==============================================================================
+# HISTÓRICO
+# ==============================================================================
+
+class HistoricoRatings:
+    """Eventos de rating em `eventos/AAAA-MM.jsonl` e posições consolidadas em `posicoes/AAAA-MM.csv`.
+
+    A posição de um mês é a do mês anterior atualizada pelos eventos do mês. O manifesto
+    registra quantos bytes de eventos cada posição já incorporou; eventos novos (inclusive
+    retroativos) invalidam a posição do seu mês e das seguintes, que são reconsolidadas na
+    próxima consulta.
+
+    Cada partição tem um índice binário (`eventos/AAAA-MM.idx`) com o hash da operação e a
+    posição de cada linha, gravado depois dos eventos. Os índices são mantidos em memória e
+    relidos só no trecho acrescentado desde a última consulta.
+    """
+
+    def __init__(self, diretorio):
+        self.diretorio = diretorio
+        os.makedirs(os.path.join(diretorio, 'eventos'), exist_ok=True)
+        os.makedirs(os.path.join(diretorio, 'posicoes'), exist_ok=True)
+        self._indices = {}  # mês -> (bytes lidos do índice, registros)
+        self._trava_indices = threading.Lock()
+
+    def _caminho_eventos(self, mes):
+        return os.path.join(self.diretorio, 'eventos', f'{mes}.jsonl')
+
+    def _caminho_indice(self, mes):
+        return os.path.join(self.diretorio, 'eventos', f'{mes}.idx')
+
+    def _caminho_posicao(self, mes):
+        return os.path.join(self.diretorio, 'posicoes', f'{mes}.csv')
+
+    def _caminho_manifesto(self):
+        return os.path.join(self.diretorio, 'posicoes', 'manifesto.json')
+
+    def _caminho_resumo(self):
+        return os.path.join(self.diretorio, 'posicoes', 'resumo_mensal.csv')
+
+    def _trava(self):
+        return trava_exclusiva(os.path.join(self.diretorio, '.trava'))
+
+    def meses_com_eventos(self):
+        return sorted(os.path.basename(c)[:-len('.jsonl')] for c in glob.glob(os.path.join(self.diretorio, 'eventos', '*.jsonl')))
+
+    # ==========================================================================
+    # ESCRITA
+    # ==========================================================================
+
+    def registrar(self, eventos):
+        """Acrescenta eventos (DataFrame ou lista de dicts com os CAMPOS_EVENTO) às partições dos seus meses."""
+        eventos = pd.DataFrame(eventos).reindex(columns=CAMPOS_EVENTO)
+        if eventos.empty: return
+        eventos['evento'] = eventos['evento'].fillna(EVENTO_RATING)
+        eventos['data'] = pd.to_datetime(eventos['data']).dt.strftime('%Y-%m-%dT%H:%M:%S')
+        eventos['op_id'] = eventos['op_id'].astype(str)
+        eventos = eventos.astype(object).where(eventos.notna(), None)
+
+        with self._trava():
+            for mes, grupo in eventos.groupby(eventos['data'].str[:7]):
+                linhas = [(json.dumps(registro, ensure_ascii=False, default=float) + '\n').encode('utf-8')
+                          for registro in grupo.to_dict('records')]
+                inicio = self._completar_indice(mes)
+                with open(self._caminho_eventos(mes), 'ab') as f:
+                    f.write(b''.join(linhas))
+                    f.flush()
+                    os.fsync(f.fileno())
+                with open(self._caminho_indice(mes), 'ab') as f:
+                    f.write(_indexar_linhas(linhas, inicio, grupo['op_id']).tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+
+    def _completar_indice(self, mes):
+        """Indexa eventos gravados sem índice (partições antigas ou escrita interrompida); retorna o tamanho da partição.
+
+        Deve ser chamado com a trava de escrita.
+        """
+        caminho_eventos, caminho_indice = self._caminho_eventos(mes), self._caminho_indice(mes)
+        tamanho_eventos = os.path.getsize(caminho_eventos) if os.path.exists(caminho_eventos) else 0
+        tamanho_indice = os.path.getsize(caminho_indice) if os.path.exists(caminho_indice) else 0
+        validos = tamanho_indice // DTYPE_INDICE_EVENTOS.itemsize
+        if tamanho_indice % DTYPE_INDICE_EVENTOS.itemsize:
+            # Registro gravado pela metade: descartado e refeito a partir dos eventos
+            with open(caminho_indice, 'r+b') as f: f.truncate(validos * DTYPE_INDICE_EVENTOS.itemsize)
+        ultimo = np.fromfile(caminho_indice, dtype=DTYPE_INDICE_EVENTOS, count=1,
+                             offset=(validos - 1) * DTYPE_INDICE_EVENTOS.itemsize) if validos else np.empty(0, DTYPE_INDICE_EVENTOS)
+        inicio = _fim_indexado(ultimo)
+        if inicio < tamanho_eventos:
+            with open(caminho_eventos, 'rb') as f:
+                f.seek(inicio)
+                linhas = f.read(tamanho_eventos - inicio).splitlines(keepends=True)
+            op_ids = [json.loads(linha)['op_id'] for linha in linhas]
+            with open(caminho_indice, 'ab') as f:
+                f.write(_indexar_linhas(linhas, inicio, op_ids).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        return tamanho_eventos
+
+    def registrar_resultado(self, operacoes, resultado, data=None, origem='lote', coluna_id='op_codigo'):
+        self.registrar(eventos_de_resultado(operacoes, resultado, data, origem, coluna_id))
+
+    def registrar_baixas(self, op_ids, data=None, origem='lote'):
+        data = pd.Timestamp(data or datetime.datetime.now()).isoformat(timespec='seconds')
+        self.registrar([{'op_id': op_id, 'data': data, 'evento': EVENTO_BAIXA, 'origem': origem} for op_id in op_ids])
+
+    # ==========================================================================
+    # LEITURA DE EVENTOS
+    # ==========================================================================
+
+    def eventos(self, mes_inicial=None, mes_final=None, op_id=None):
+        """Eventos brutos no intervalo de meses (inclusive), opcionalmente de uma única operação."""
+        meses = [mes for mes in self.meses_com_eventos()
+                 if not ((mes_inicial and mes < mes_inicial) or (mes_final and mes > mes_final))]
+        if not meses: return pd.DataFrame(columns=CAMPOS_EVENTO)
+        if op_id is not None:
+            linhas = [linha for mes in meses for linha in self._eventos_operacao(mes, str(op_id))]
+            partes = [pd.DataFrame(linhas, columns=CAMPOS_EVENTO)]
+        else:
+            partes = [pd.read_json(self._caminho_eventos(mes), lines=True, dtype={'op_id': str, 'hash_entradas': str}) for mes in meses]
+        eventos = pd.concat(partes, ignore_index=True).reindex(columns=CAMPOS_EVENTO)
+        eventos['data'] = pd.to_datetime(eventos['data'])
+        return eventos.sort_values('data', kind='stable', ignore_index=True)
+
+    def _indice_mes(self, mes):
+        """Registros do índice da partição, lidos do disco só no trecho novo desde a última consulta."""
+        caminho = self._caminho_indice(mes)
+        tamanho = os.path.getsize(caminho) if os.path.exists(caminho) else 0
+        tamanho -= tamanho % DTYPE_INDICE_EVENTOS.itemsize
+        with self._trava_indices:
+            lidos, registros = self._indices.get(mes, (0, np.empty(0, DTYPE_INDICE_EVENTOS)))
+            if tamanho > lidos:
+                novos = np.fromfile(caminho, dtype=DTYPE_INDICE_EVENTOS, count=(tamanho - lidos) // DTYPE_INDICE_EVENTOS.itemsize, offset=lidos)
+                registros = np.concatenate([registros, novos])
+                self._indices[mes] = (tamanho, registros)
+        return registros
+
+    def _eventos_operacao(self, mes, op_id):
+        """Eventos (dicts) de uma operação no mês, lendo só as linhas apontadas pelo índice."""
+        registros = self._indice_mes(mes)
+        if _fim_indexado(registros) < os.path.getsize(self._caminho_eventos(mes)):
+            with self._trava():
+                self._completar_indice(mes)
+            registros = self._indice_mes(mes)
+        registros = registros[registros['hash_op'] == _hash_ops([op_id])[0]]
+        linhas = []
+        with open(self._caminho_eventos(mes), 'rb') as f:
+            for inicio, tamanho in zip(registros['inicio'].tolist(), registros['tamanho'].tolist()):
+                f.seek(inicio)
+                linhas.append(json.loads(f.read(tamanho)))
+        return [linha for linha in linhas if linha['op_id'] == op_id]  # descarta colisões de hash
+
+    def historico_operacao(self, op_id):
+        """Todos os eventos de uma operação, em ordem cronológica."""
+        return self.eventos(op_id=op_id)
+
+    # ==========================================================================
+    # POSIÇÕES MENSAIS
+    # ==========================================================================
+
+    def consolidar(self):
+        """Atualiza as posições e o resumo mensal a partir do primeiro mês com eventos novos."""
+        with self._trava():
+            self._consolidar()
+
+    def _consolidar(self):
+        meses = self.meses_com_eventos()
+        if not meses: return
+        try:
+            with open(self._caminho_manifesto()) as f: manifesto = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            manifesto = {}
+        tamanhos = {mes: os.path.getsize(self._caminho_eventos(mes)) for mes in meses}
+        todos_meses = _meses_entre(meses[0], max(meses[-1], chave_mes(datetime.date.today())))
+        resumo = self._ler_resumo()
+        pendentes = [m for m in meses if manifesto.get(m) != tamanhos[m] or not os.path.exists(self._caminho_posicao(m))]
+        pendentes += [m for m in todos_meses if m not in resumo.index][:1]  # meses novos só estendem o resumo
+        if not pendentes: return
+
+        primeiro = min(pendentes)
+        anteriores = [m for m in todos_meses if m < primeiro]
+        anterior = self.posicao(anteriores[-1], consolidar=False) if anteriores else None
+        resumo = resumo[resumo.index < primeiro]
+        linhas_resumo = []
+        for mes in todos_meses[len(anteriores):]:
+            if mes in tamanhos:
+                eventos_mes = self.eventos(mes, mes)
+                posicao = self._atualizar_posicao(anterior, eventos_mes)
+                temporario = self._caminho_posicao(mes) + '.tmp'
+                posicao.to_csv(temporario, index_label='op_id')
+                os.replace(temporario, self._caminho_posicao(mes))
+                linhas_resumo.append(self._resumir(mes, anterior, posicao, len(eventos_mes)))
+                manifesto[mes] = tamanhos[mes]
+                anterior = posicao
+            else:
+                # Mês sem eventos: a posição é a do mês anterior (sem arquivo próprio)
+                linha = dict(linhas_resumo[-1]) if linhas_resumo else resumo.iloc[-1].to_dict()
+                linhas_resumo.append(linha | {'mes': mes, 'eventos': 0, 'upgrades': 0, 'downgrades': 0})
+
+        resumo = pd.concat([resumo, pd.DataFrame(linhas_resumo).set_index('mes')])
+        temporario = self._caminho_resumo() + '.tmp'
+        resumo.to_csv(temporario, index_label='mes')
+        os.replace(temporario, self._caminho_resumo())
+        with open(self._caminho_manifesto() + '.tmp', 'w') as f: json.dump(manifesto, f)
+        os.replace(self._caminho_manifesto() + '.tmp', self._caminho_manifesto())
+
+    @staticmethod
+    def _atualizar_posicao(anterior, eventos_mes):
+        ultimos = eventos_mes.drop_duplicates('op_id', keep='last').set_index('op_id')
+        colunas = [c for c in CAMPOS_EVENTO if c != 'op_id']
+        if anterior is None or anterior.empty:
+            posicao = ultimos[colunas]
+        else:
+            posicao = pd.concat([anterior[~anterior.index.isin(ultimos.index)], ultimos[colunas]])
+        return posicao[posicao['evento'] != EVENTO_BAIXA].sort_index()
+
+    @staticmethod
+    def _resumir(mes, anterior, posicao, n_eventos):
+        linha = {'mes': mes, 'operacoes': len(posicao), 'eventos': n_eventos,
+                 'exposicao': float(pd.to_numeric(posicao['exposicao'], errors='coerce').sum()),
+                 'score_medio': float(pd.to_numeric(posicao['score_final'], errors='coerce').mean()) if len(posicao) else np.nan,
+                 'spread_medio': float(pd.to_numeric(posicao['spread_credito'], errors='coerce').mean()) if len(posicao) else np.nan}
+        delta = pd.Series(dtype=float)
+        if anterior is not None and not anterior.empty:
+            comuns = anterior.index.intersection(posicao.index)
+            delta = posicao.loc[comuns, 'rating_final'].map(INDICE_RATING) - anterior.loc[comuns, 'rating_final'].map(INDICE_RATING)
+        linha['upgrades'], linha['downgrades'] = int((delta > 0).sum()), int((delta < 0).sum())
+        contagem = posicao['rating_final'].value_counts()
+        linha.update({rating: int(contagem.get(rating, 0)) for rating in reversed(ESCALA_RATING)})
+        return linha
+
+    def _ler_resumo(self):
+        if not os.path.exists(self._caminho_resumo()): return pd.DataFrame(index=pd.Index([], dtype=object, name='mes'))
+        return pd.read_csv(self._caminho_resumo(), index_col='mes', dtype={'mes': str})
+
+    def posicao(self, mes, consolidar=True):
+        """Posição da carteira no fim do mês: último evento de cada operação ativa, indexado por operação."""
+        if consolidar: self.consolidar()
+        # Meses sem partição própria (futuros) valem a última posição consolidada
+        consolidados = sorted(os.path.basename(c)[:-len('.csv')] for c in glob.glob(os.path.join(self.diretorio, 'posicoes', '????-??.csv')))
+        anteriores = [m for m in consolidados if m <= mes]
+        if not anteriores: return pd.DataFrame(columns=CAMPOS_EVENTO[1:]).rename_axis('op_id')
+        caminho = self._caminho_posicao(anteriores[-1])
+        return pd.read_csv(caminho, index_col='op_id', dtype={'op_id': str, 'hash_entradas': str})
+
+    # ==========================================================================
+    # CONSULTAS
+    # ==========================================================================
+
+    def serie_temporal(self):
+        """Resumo mensal da carteira: operações, exposição, score e spread médios, migrações e distribuição por rating."""
+        self.consolidar()
+        return self._ler_resumo()
+
+    def matriz_migracao(self, mes_inicial, mes_final, ponderar_exposicao=False):
+        """Matriz de migração do rating final entre as posições de dois meses (operações presentes em ambas)."""
+        inicial, final = self.posicao(mes_inicial), self.posicao(mes_final, consolidar=False)
+        comuns = inicial.index.intersection(final.index)
+        pesos = pd.to_numeric(final.loc[comuns, 'exposicao'], errors='coerce').fillna(0) if ponderar_exposicao else None
+        matriz = pd.crosstab(inicial.loc[comuns, 'rating_final'], final.loc[comuns, 'rating_final'],
+                             values=pesos, aggfunc='sum' if ponderar_exposicao else None,
+                             rownames=['Rating anterior'], colnames=['Rating atual'])
+        ordem = list(reversed(ESCALA_RATING))
+        return matriz.reindex(index=ordem, columns=ordem, fill_value=0).fillna(0)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Consultas ao histórico de ratings da carteira de CCIs')
+    parser.add_argument('diretorio', help='Diretório do histórico (ex.: dados/historico_ratings)')
+    parser.add_argument('--serie', action='store_true', help='Imprime o resumo mensal da carteira')
+    parser.add_argument('--migracao', nargs=2, metavar=('MES_INICIAL', 'MES_FINAL'), help="Matriz de migração entre dois meses 'AAAA-MM'")
+    parser.add_argument('--operacao', default=None, help='Histórico de eventos de uma operação')
+    args = parser.parse_args()
+
+    historico = HistoricoRatings(args.diretorio)
+    if args.serie: print(historico.serie_temporal().to_string())
+    if args.migracao: print(historico.matriz_migracao(*args.migracao).to_string())
+    if args.operacao: print(historico.historico_operacao(args.operacao).to_string())
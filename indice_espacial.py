@@ -0,0 +1,145 @@
+# indice_espacial.py
+# Índice espacial sobre garantias geocodificadas: buckets de geohash para concentração
+# regional e KD-tree (coordenadas 3D na esfera unitária) para busca de comparáveis por raio.
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+RAIO_TERRA_KM = 6371.0088
+_BASE32_GEOHASH = np.frombuffer(b'0123456789bcdefghjkmnpqrstuvwxyz', dtype=np.uint8)
+
+# Faixas usadas para sugerir os campos qualitativos do Pilar 1
+MIN_COMPARAVEIS_SIM = 10
+MIN_COMPARAVEIS_PARCIAL = 3
+ANOS_LANCAMENTO_RECENTE = 3
+LIMITES_LANCAMENTOS = [(0.10, 'Baixo, bairro consolidado'), (0.25, 'Médio, alguns lançamentos')]
+
+# ==============================================================================
+# FUNÇÕES AUXILIARES
+# ==============================================================================
+
+def _para_xyz(lat, lon):
+    lat_rad, lon_rad = np.radians(np.asarray(lat, dtype=float)), np.radians(np.asarray(lon, dtype=float))
+    cos_lat = np.cos(lat_rad)
+    return np.column_stack([cos_lat * np.cos(lon_rad), cos_lat * np.sin(lon_rad), np.sin(lat_rad)])
+
+def _km_para_corda(distancia_km):
+    return 2 * np.sin(np.minimum(np.asarray(distancia_km, dtype=float) / RAIO_TERRA_KM, np.pi) / 2)
+
+def _corda_para_km(corda):
+    return 2 * RAIO_TERRA_KM * np.arcsin(np.clip(np.asarray(corda, dtype=float) / 2, 0, 1))
+
+def codificar_geohash(lat, lon, precisao=5):
+    """Geohash vetorizado (até 12 caracteres): retorna um array de strings com `precisao` caracteres."""
+    lat, lon = np.atleast_1d(np.asarray(lat, dtype=float)), np.atleast_1d(np.asarray(lon, dtype=float))
+    n_bits = 5 * precisao
+    bits_lon, bits_lat = (n_bits + 1) // 2, n_bits // 2
+    q_lon = np.clip(((lon + 180) / 360 * (1 << bits_lon)).astype(np.int64), 0, (1 << bits_lon) - 1)
+    q_lat = np.clip(((lat + 90) / 180 * (1 << bits_lat)).astype(np.int64), 0, (1 << bits_lat) - 1)
+
+    # Intercala os bits (longitude nas posições pares, começando pelo bit mais significativo)
+    codigo = np.zeros(len(lat), dtype=np.int64)
+    for i in range(n_bits):
+        if i % 2 == 0: bit = (q_lon >> (bits_lon - 1 - i // 2)) & 1
+        else: bit = (q_lat >> (bits_lat - 1 - i // 2)) & 1
+        codigo = (codigo << 1) | bit
+
+    caracteres = np.stack([_BASE32_GEOHASH[(codigo >> (5 * (precisao - 1 - j))) & 31] for j in range(precisao)], axis=1)
+    return np.ascontiguousarray(caracteres).view(f'S{precisao}').ravel().astype(str)
+
+def indice_herfindahl(participacoes):
+    """HHI (0 a 1) a partir das participações de cada região."""
+    participacoes = np.asarray(participacoes, dtype=float)
+    return float(np.sum(participacoes ** 2))
+
+# ==============================================================================
+# ÍNDICE ESPACIAL
+# ==============================================================================
+
+class IndiceEspacial:
+    """Índice sobre um conjunto de imóveis geocodificados (colunas `lat` e `lon`).
+
+    As demais colunas do DataFrame (valor, tipologia, ano de lançamento etc.) são
+    preservadas e devolvidas nas buscas.
+    """
+
+    def __init__(self, df, precisao_geohash=5):
+        validos = df['lat'].notna() & df['lon'].notna()
+        self.dados = df.loc[validos].reset_index(drop=True)
+        self.precisao_geohash = precisao_geohash
+        self._lat = self.dados['lat'].to_numpy(dtype=float)
+        self._lon = self.dados['lon'].to_numpy(dtype=float)
+        self._arvore = cKDTree(_para_xyz(self._lat, self._lon), balanced_tree=False, compact_nodes=True)
+        self.geohash = codificar_geohash(self._lat, self._lon, precisao_geohash)
+
+    def __len__(self):
+        return len(self.dados)
+
+    @classmethod
+    def de_arquivo(cls, caminho, precisao_geohash=5):
+        """Carrega a base de referência de um CSV ou Parquet com ao menos as colunas `lat` e `lon`."""
+        df = pd.read_parquet(caminho) if str(caminho).endswith('.parquet') else pd.read_csv(caminho)
+        return cls(df, precisao_geohash)
+
+    def buscar_raio(self, lat, lon, raio_km):
+        """Imóveis a até `raio_km` do ponto, ordenados por distância (coluna `distancia_km`)."""
+        ponto = _para_xyz([lat], [lon])[0]
+        indices = self._arvore.query_ball_point(ponto, _km_para_corda(raio_km))
+        return self._resultado(ponto, np.asarray(indices, dtype=np.int64))
+
+    def vizinhos_mais_proximos(self, lat, lon, k=10, raio_max_km=None):
+        """Os `k` imóveis mais próximos do ponto, opcionalmente limitados a `raio_max_km`."""
+        ponto = _para_xyz([lat], [lon])[0]
+        if len(self) == 0: return self._resultado(ponto, np.empty(0, dtype=np.int64))
+        limite = _km_para_corda(raio_max_km) if raio_max_km is not None else np.inf
+        _, indices = self._arvore.query(ponto, k=min(k, len(self)), distance_upper_bound=limite)
+        indices = np.atleast_1d(indices)
+        return self._resultado(ponto, indices[indices < len(self)])
+
+    def _resultado(self, ponto, indices):
+        comparaveis = self.dados.iloc[indices].copy()
+        comparaveis['distancia_km'] = _corda_para_km(np.linalg.norm(_para_xyz(self._lat[indices], self._lon[indices]) - ponto, axis=1))
+        return comparaveis.sort_values('distancia_km')
+
+    def concentracao_regional(self, coluna_exposicao=None, precisao=None):
+        """Exposição por bucket de geohash, com participação e HHI (em `attrs['hhi']`)."""
+        precisao = precisao or self.precisao_geohash
+        if precisao > self.precisao_geohash:
+            raise ValueError(f"Precisão {precisao} maior que a do índice ({self.precisao_geohash}); recrie o índice com precisao_geohash={precisao}.")
+        regioes = self.geohash if precisao == self.precisao_geohash else self.geohash.astype(f'U{precisao}')
+        exposicao = self.dados[coluna_exposicao].to_numpy(dtype=float) if coluna_exposicao else np.ones(len(self))
+        resumo = (pd.DataFrame({'regiao': regioes, 'exposicao': exposicao, 'lat': self._lat, 'lon': self._lon})
+                  .groupby('regiao').agg(qtd=('exposicao', 'size'), exposicao=('exposicao', 'sum'), lat=('lat', 'mean'), lon=('lon', 'mean'))
+                  .sort_values('exposicao', ascending=False))
+        resumo['participacao'] = resumo['exposicao'] / resumo['exposicao'].sum() if len(resumo) else resumo['exposicao']
+        resumo.attrs['hhi'] = indice_herfindahl(resumo['participacao'])
+        return resumo
+
+# ==============================================================================
+# SUGESTÕES PARA O PILAR 1
+# ==============================================================================
+
+def sugerir_qualidade_comparaveis(comparaveis):
+    n = len(comparaveis)
+    if n >= MIN_COMPARAVEIS_SIM: return 'Sim'
+    elif n >= MIN_COMPARAVEIS_PARCIAL: return 'Parcialmente'
+    else: return 'Não'
+
+def sugerir_risco_oferta(comparaveis, ano_referencia):
+    """Classifica o risco de oferta pela fração de lançamentos recentes entre os comparáveis."""
+    if 'ano_lancamento' not in comparaveis.columns or comparaveis.empty: return None
+    recentes = (comparaveis['ano_lancamento'] >= ano_referencia - ANOS_LANCAMENTO_RECENTE).mean()
+    for limite, classificacao in LIMITES_LANCAMENTOS:
+        if recentes < limite: return classificacao
+    return 'Alto, muitos lançamentos'
+
+def analisar_comparaveis(indice, lat, lon, raio_km, ano_referencia, tipo_imovel=None):
+    """Busca comparáveis no raio (opcionalmente da mesma tipologia) e sugere os campos do Pilar 1."""
+    comparaveis = indice.buscar_raio(lat, lon, raio_km)
+    if tipo_imovel and 'tipo_imovel' in comparaveis.columns:
+        comparaveis = comparaveis[comparaveis['tipo_imovel'] == tipo_imovel]
+    return {
+        'comparaveis': comparaveis,
+        'qualidade_comparaveis': sugerir_qualidade_comparaveis(comparaveis),
+        'risco_oferta': sugerir_risco_oferta(comparaveis, ano_referencia),
+    }
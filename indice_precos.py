@@ -0,0 +1,179 @@
+# indice_precos.py
+# Base local de índices de preço de imóveis (estilo FipeZAP) e de tempo de venda por região.
+# Os arquivos são carregados uma única vez em matrizes densas (região x mês), de modo que
+# cada consulta é uma indexação direta, sem leitura de arquivo.
+import datetime
+import glob
+import os
+import unicodedata
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+SEPARADOR_REGIAO = '/'  # ex.: "São Paulo, SP/Pinheiros" -> bairro dentro da cidade
+JANELA_VOLATILIDADE = 12
+MAX_DEFASAGEM_MESES = 3  # consultas além do último mês da base por mais que isso não são respondidas
+
+# ==============================================================================
+# FUNÇÕES AUXILIARES
+# ==============================================================================
+
+def normalizar_regiao(regiao):
+    """Chave canônica de região: sem acentos, minúsculas e sem espaços redundantes."""
+    if not isinstance(regiao, str): return ''
+    sem_acentos = unicodedata.normalize('NFKD', regiao).encode('ascii', 'ignore').decode('ascii')
+    partes = [' '.join(p.lower().split()) for p in sem_acentos.split(SEPARADOR_REGIAO)]
+    return SEPARADOR_REGIAO.join(p for p in partes if p)
+
+def mes_absoluto(data):
+    """Converte data, datetime, Timestamp ou 'AAAA-MM' em um inteiro de meses (ano * 12 + mês - 1)."""
+    if isinstance(data, str): data = pd.Timestamp(data)
+    return data.year * 12 + data.month - 1
+
+def _meses_absolutos(datas):
+    datas = pd.to_datetime(pd.Series(datas), errors='coerce')
+    return (datas.dt.year * 12 + datas.dt.month - 1).to_numpy(dtype=float)
+
+# ==============================================================================
+# BASE DE ÍNDICES
+# ==============================================================================
+
+class BaseIndicesPrecos:
+    """Séries mensais de índice de preço e de tempo médio de venda, indexadas por (região, mês).
+
+    Colunas esperadas nos arquivos: `regiao`, `mes` (data ou 'AAAA-MM'), `indice` e,
+    opcionalmente, `dias_venda`. Datas posteriores ao último mês da base usam a última
+    observação, desde que a defasagem não passe de `max_defasagem_meses`.
+    """
+
+    def __init__(self, df, max_defasagem_meses=MAX_DEFASAGEM_MESES):
+        self.max_defasagem_meses = max_defasagem_meses
+        df = df.assign(regiao=df['regiao'].map(normalizar_regiao), mes=_meses_absolutos(df['mes']))
+        df = df.dropna(subset=['mes'])
+        df = df[df['regiao'] != ''].astype({'mes': np.int64})
+
+        self.regioes = {regiao: i for i, regiao in enumerate(sorted(df['regiao'].unique()))}
+        self.mes_inicial = int(df['mes'].min()) if len(df) else 0
+        n_meses = int(df['mes'].max()) - self.mes_inicial + 1 if len(df) else 0
+        linhas = df['regiao'].map(self.regioes).to_numpy()
+        colunas = df['mes'].to_numpy() - self.mes_inicial
+
+        self.indice = np.full((len(self.regioes), n_meses), np.nan)
+        self.indice[linhas, colunas] = df['indice'].to_numpy(dtype=float)
+        self.dias_venda = np.full(self.indice.shape, np.nan, dtype=np.float32)
+        if 'dias_venda' in df.columns:
+            self.dias_venda[linhas, colunas] = df['dias_venda'].to_numpy(dtype=np.float32)
+            # O tempo de venda é divulgado com menor frequência; vale o último dado disponível
+            self.dias_venda = pd.DataFrame(self.dias_venda).ffill(axis=1).to_numpy(dtype=np.float32)
+
+        self._variacao_12m = None
+        self._volatilidade = None
+        self.variacao_12m = lru_cache(maxsize=65536)(self._variacao_12m_escalar)
+        self.volatilidade = lru_cache(maxsize=65536)(self._volatilidade_escalar)
+
+    @classmethod
+    def de_diretorio(cls, diretorio, max_defasagem_meses=MAX_DEFASAGEM_MESES):
+        """Carrega todos os CSVs (e Parquets) de um diretório em uma única base."""
+        arquivos = sorted(glob.glob(os.path.join(diretorio, '*.csv')) + glob.glob(os.path.join(diretorio, '*.parquet')))
+        if not arquivos: return None
+        partes = [pd.read_parquet(a) if a.endswith('.parquet') else pd.read_csv(a) for a in arquivos]
+        return cls(pd.concat(partes, ignore_index=True), max_defasagem_meses)
+
+    @property
+    def n_meses(self):
+        return self.indice.shape[1]
+
+    # --- Matrizes derivadas (calculadas uma vez, na primeira consulta) ---
+
+    def matriz_variacao_12m(self):
+        """Variação percentual em 12 meses para todas as regiões e meses."""
+        if self._variacao_12m is None:
+            variacao = np.full_like(self.indice, np.nan)
+            variacao[:, 12:] = (self.indice[:, 12:] / self.indice[:, :-12] - 1) * 100
+            self._variacao_12m = variacao
+        return self._variacao_12m
+
+    def matriz_volatilidade(self):
+        """Volatilidade anualizada (%) dos retornos mensais na janela de 12 meses."""
+        if self._volatilidade is None:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                retornos = np.diff(np.log(self.indice), axis=1, prepend=np.nan)
+            desvio = pd.DataFrame(retornos).T.rolling(JANELA_VOLATILIDADE, min_periods=JANELA_VOLATILIDADE).std().T.to_numpy()
+            self._volatilidade = (desvio * np.sqrt(12) * 100).astype(np.float32)
+        return self._volatilidade
+
+    # --- Posicionamento (região, mês) ---
+
+    def _linha(self, regiao):
+        """Linha da região; se o bairro não estiver na base, recorre à cidade."""
+        chave = normalizar_regiao(regiao)
+        while chave:
+            if chave in self.regioes: return self.regioes[chave]
+            chave = chave.rpartition(SEPARADOR_REGIAO)[0]
+        return None
+
+    def _coluna(self, mes):
+        # Meses posteriores ao último dado usam a última observação disponível, dentro da defasagem máxima
+        coluna = mes - self.mes_inicial
+        if coluna - (self.n_meses - 1) > self.max_defasagem_meses: return None
+        coluna = min(coluna, self.n_meses - 1)
+        return coluna if coluna >= 0 else None
+
+    def mes_utilizado(self, data):
+        """(mês 'AAAA-MM' cujos dados respondem às consultas na data, defasagem em meses); None fora da base."""
+        mes = mes_absoluto(data)
+        coluna = self._coluna(mes)
+        if coluna is None: return None
+        usado = self.mes_inicial + coluna
+        return f"{usado // 12:04d}-{usado % 12 + 1:02d}", mes - usado
+
+    def _consultar(self, matriz, regiao, data):
+        linha, coluna = self._linha(regiao), self._coluna(mes_absoluto(data))
+        if linha is None or coluna is None: return None
+        valor = matriz[linha, coluna]
+        return None if np.isnan(valor) else float(valor)
+
+    def _variacao_12m_escalar(self, regiao, data):
+        return self._consultar(self.matriz_variacao_12m(), regiao, data)
+
+    def _volatilidade_escalar(self, regiao, data):
+        return self._consultar(self.matriz_volatilidade(), regiao, data)
+
+    def liquidez_dias(self, regiao, data):
+        return self._consultar(self.dias_venda, regiao, data)
+
+    # --- Consultas em lote ---
+
+    def consultar_lote(self, regioes, datas):
+        """Variação 12m, volatilidade e dias de venda para arrays de regiões e datas (NaN quando ausente)."""
+        regioes = pd.Series(regioes, dtype=object)
+        linhas_unicas = {r: self._linha(r) for r in regioes.unique()}
+        linhas = regioes.map(linhas_unicas).to_numpy(dtype=float)
+        colunas = _meses_absolutos(datas) - self.mes_inicial
+        validos = ~np.isnan(linhas) & ~np.isnan(colunas) & (colunas - (self.n_meses - 1) <= self.max_defasagem_meses)
+        colunas = np.minimum(colunas, self.n_meses - 1)
+        validos &= colunas >= 0
+        l, c = linhas[validos].astype(np.int64), colunas[validos].astype(np.int64)
+
+        resultado = {}
+        for nome, matriz in (('fipezap_12m', self.matriz_variacao_12m()), ('volatilidade_12m', self.matriz_volatilidade()),
+                             ('liquidez_dias', self.dias_venda)):
+            valores = np.full(len(regioes), np.nan)
+            valores[validos] = matriz[l, c]
+            resultado[nome] = valores
+        return pd.DataFrame(resultado, index=regioes.index)
+
+    def preencher_operacoes(self, df, coluna_regiao='cidade_mapa', coluna_data=None, data_referencia=None):
+        """Preenche `fipezap_12m` e `liquidez_dias` ausentes (NaN/None) a partir da base; valores informados, mesmo inválidos, são mantidos."""
+        datas = df[coluna_data] if coluna_data else pd.Series(data_referencia or datetime.date.today(), index=df.index)
+        consulta = self.consultar_lote(df[coluna_regiao].to_numpy(), datas.to_numpy())
+        consulta.index = df.index
+        preenchido = df.copy()
+        for campo in ('fipezap_12m', 'liquidez_dias'):
+            if campo not in preenchido.columns:
+                preenchido[campo] = consulta[campo]
+            else:
+                # Só valores ausentes são preenchidos; valores malformados seguem para a validação
+                preenchido[campo] = preenchido[campo].where(preenchido[campo].notna(), consulta[campo])
+        return preenchido
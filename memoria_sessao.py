@@ -0,0 +1,141 @@
+# memoria_sessao.py
+# Controle de memória das sessões do app: artefatos grandes (relatórios PDF, textos de IA)
+# ficam em um armazém único do processo, endereçados por chave, e o session_state guarda
+# apenas a chave. Inclui a estimativa de bytes ocupados por cada chave do estado de uma sessão.
+import hashlib
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+LIMITE_POR_SESSAO = 8 * 1024 ** 2
+LIMITE_TOTAL = 256 * 1024 ** 2
+TEMPO_OCIOSO_SESSAO = 60 * 60  # segundos sem acesso até a sessão (provavelmente encerrada) perder suas referências
+
+# ==============================================================================
+# FUNÇÕES AUXILIARES
+# ==============================================================================
+
+def chave_conteudo(*partes):
+    """Chave (sha1) de um conteúdo ou das entradas que o determinam."""
+    h = hashlib.sha1()
+    for parte in partes:
+        h.update(parte if isinstance(parte, bytes) else str(parte).encode())
+        h.update(b'\0')
+    return h.hexdigest()
+
+def tamanho_objeto(obj, _vistos=None):
+    """Estimativa (bytes) da memória de um objeto, incluindo o conteúdo de contêineres, DataFrames e arrays."""
+    vistos = set() if _vistos is None else _vistos
+    if id(obj) in vistos: return 0
+    vistos.add(id(obj))
+    if isinstance(obj, pd.DataFrame): return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, (pd.Series, pd.Index)): return int(obj.memory_usage(deep=True))
+    # Arrays donos dos dados contam os dados; visões e memmaps (páginas compartilhadas do arquivo) só o cabeçalho
+    if isinstance(obj, np.ndarray): return sys.getsizeof(obj)
+    tamanho = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        tamanho += sum(tamanho_objeto(k, vistos) + tamanho_objeto(v, vistos) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        tamanho += sum(tamanho_objeto(v, vistos) for v in obj)
+    return tamanho
+
+# ==============================================================================
+# ARMAZÉM DE ARTEFATOS
+# ==============================================================================
+
+class ArmazemArtefatos:
+    """Artefatos grandes das sessões, fora do session_state, compartilhados por chave.
+
+    Conteúdos iguais (mesma chave) são guardados uma única vez, mesmo que várias sessões os
+    referenciem. Cada sessão mantém no máximo um artefato por rótulo (ex.: o PDF vigente) e até
+    `limite_por_sessao` bytes; acima disso perde as referências mais antigas. Acima de
+    `limite_total`, os conteúdos menos usados do processo são descartados: quem lê deve tratar
+    `obter() is None` regenerando o artefato. Sessões sem acesso há mais de `tempo_ocioso` segundos
+    (o Streamlit não avisa quando uma sessão termina) perdem suas referências na próxima coleta.
+    """
+
+    def __init__(self, limite_por_sessao=LIMITE_POR_SESSAO, limite_total=LIMITE_TOTAL, tempo_ocioso=TEMPO_OCIOSO_SESSAO):
+        self.limite_por_sessao = limite_por_sessao
+        self.limite_total = limite_total
+        self.tempo_ocioso = tempo_ocioso
+        self._conteudos = OrderedDict()  # chave -> (conteúdo, bytes), do menos para o mais recente
+        self._sessoes = {}               # sessão -> OrderedDict(rótulo -> chave), do menos para o mais recente
+        self._acessos = {}               # sessão -> último acesso (time.monotonic)
+        self._trava = threading.Lock()
+
+    def guardar(self, sessao, rotulo, conteudo, chave=None):
+        """Guarda o conteúdo (se ainda não existir) e o referencia na sessão; retorna a chave."""
+        chave = chave or chave_conteudo(conteudo)
+        with self._trava:
+            self._acessos[sessao] = time.monotonic()
+            if chave not in self._conteudos:
+                self._conteudos[chave] = (conteudo, tamanho_objeto(conteudo))
+            self._conteudos.move_to_end(chave)
+            referencias = self._sessoes.setdefault(sessao, OrderedDict())
+            referencias[rotulo] = chave
+            referencias.move_to_end(rotulo)
+            while len(referencias) > 1 and self._bytes(set(referencias.values())) > self.limite_por_sessao:
+                referencias.popitem(last=False)
+            self._coletar()
+        return chave
+
+    def obter(self, chave, sessao=None):
+        """Conteúdo da chave (None se descartado); informar a sessão renova o prazo de ociosidade dela."""
+        with self._trava:
+            if sessao in self._sessoes: self._acessos[sessao] = time.monotonic()
+            if chave not in self._conteudos: return None
+            self._conteudos.move_to_end(chave)
+            return self._conteudos[chave][0]
+
+    def __contains__(self, chave):
+        return chave in self._conteudos
+
+    def _bytes(self, chaves):
+        return sum(self._conteudos[c][1] for c in chaves if c in self._conteudos)
+
+    def _coletar(self):
+        limite_acesso = time.monotonic() - self.tempo_ocioso
+        for sessao in [s for s, acesso in self._acessos.items() if acesso < limite_acesso]:
+            self._sessoes.pop(sessao, None)
+        referenciadas = {chave for referencias in self._sessoes.values() for chave in referencias.values()}
+        for chave in [c for c in self._conteudos if c not in referenciadas]:
+            del self._conteudos[chave]
+        while len(self._conteudos) > 1 and self._bytes(self._conteudos) > self.limite_total:
+            chave, _ = self._conteudos.popitem(last=False)
+            for referencias in self._sessoes.values():
+                for rotulo in [r for r, c in referencias.items() if c == chave]:
+                    del referencias[rotulo]
+        for sessao in [s for s, referencias in self._sessoes.items() if not referencias]:
+            del self._sessoes[sessao]
+        for sessao in [s for s in self._acessos if s not in self._sessoes]:
+            del self._acessos[sessao]
+
+    def uso(self, sessao=None):
+        """Bytes guardados no processo ou referenciados por uma sessão."""
+        with self._trava:
+            return self._bytes(self._conteudos if sessao is None else set(self._sessoes.get(sessao, {}).values()))
+
+    def artefatos(self, sessao):
+        """[(rótulo, chave, bytes)] dos artefatos referenciados pela sessão."""
+        with self._trava:
+            return [(rotulo, chave, self._conteudos[chave][1]) for rotulo, chave in self._sessoes.get(sessao, {}).items()
+                    if chave in self._conteudos]
+
+# ==============================================================================
+# RELATÓRIO DE MEMÓRIA
+# ==============================================================================
+
+def relatorio_memoria(estado, armazem=None, sessao=None):
+    """Bytes por chave do estado da sessão e por artefato referenciado no armazém, do maior para o menor."""
+    vistos = set()
+    linhas = [{'chave': str(chave), 'tipo': type(valor).__name__, 'local': 'session_state', 'bytes': tamanho_objeto(valor, vistos)}
+              for chave, valor in estado.items()]
+    if armazem is not None and sessao is not None:
+        linhas += [{'chave': rotulo, 'tipo': 'artefato', 'local': 'armazém compartilhado', 'bytes': tamanho}
+                   for rotulo, _, tamanho in armazem.artefatos(sessao)]
+    relatorio = pd.DataFrame(linhas, columns=['chave', 'tipo', 'local', 'bytes'])
+    return relatorio.sort_values('bytes', ascending=False, ignore_index=True)
@@ -0,0 +1,463 @@
+# motor_rating.py
+# Motor de cálculo da metodologia de rating de CCIs, sem dependência do Streamlit.
+# Todas as funções operam sobre colunas (arrays numpy), de modo que a mesma lógica
+# atende tanto a análise individual do app quanto o processamento em lote.
+import math
+
+import numpy as np
+import numpy_financial as npf
+import pandas as pd
+
+# ==============================================================================
+# TABELAS DA METODOLOGIA
+# ==============================================================================
+
+PESOS_PILARES = {'pilar1': 0.30, 'pilar2': 0.40, 'pilar3': 0.30}
+
+ESCALA_RATING = ['brD(sf)', 'brC(sf)', 'brCC(sf)', 'brCCC(sf)', 'brB(sf)', 'brBB(sf)', 'brBBB(sf)', 'brA(sf)', 'brAA(sf)', 'brAAA(sf)']
+INDICE_RATING = {rating: i for i, rating in enumerate(ESCALA_RATING)}
+# Limites inferiores de score para cada rating, do melhor para o pior
+LIMITES_RATING = [(4.75, 'brAAA(sf)'), (4.25, 'brAA(sf)'), (3.75, 'brA(sf)'), (3.25, 'brBBB(sf)'), (2.75, 'brBB(sf)'),
+                  (2.50, 'brB(sf)'), (2.25, 'brCCC(sf)'), (2.00, 'brCC(sf)'), (1.50, 'brC(sf)')]
+
+MATRIZ_SPREAD_BASE = {
+    'brAAA(sf)': 3.50, 'brAA(sf)': 4.00, 'brA(sf)': 4.50,
+    'brBBB(sf)': 5.50, 'brBB(sf)': 6.50, 'brB(sf)': 7.50,
+    'brCCC(sf)': 9.50,
+}
+SPREAD_PADRAO = 10.00
+PENALIDADE_HOME_EQUITY = 0.65  # 65 bps adicionais de spread para Home Equity
+
+HISTORICO_NOVO = 'Novo, sem histórico de pagamento'
+
+MAPAS = {
+    # --- Pilar 1 ---
+    'credibilidade_avaliador': {'1ª Linha Nacional': 5, 'Regional Conhecido': 4, 'Pouco Conhecido': 2},
+    'qualidade_comparaveis': {'Sim': 5, 'Parcialmente': 3, 'Não': 1},
+    'risco_oferta': {'Baixo, bairro consolidado': 5, 'Médio, alguns lançamentos': 3, 'Alto, muitos lançamentos': 1},
+    'adequacao_produto': {'Ideal': 5, 'Adequado': 4, 'Pouco Adequado': 2},
+    'reputacao_construtora': {'1ª Linha': 5, 'Média': 3, 'Baixa/Desconhecida': 2},
+    'estado_conservacao': {'Novo/Reformado': 5, 'Bom, com manutenção': 4, 'Regular, necessita reparos': 2, 'Ruim': 1},
+    'risco_ambiental_imovel': {'Inexistente': 5, 'Baixo/Gerenciado': 4, 'Requer análise': 2},
+    # --- Pilar 2 ---
+    'finalidade_credito': {'Financiamento de Aquisição': 5, 'Financiamento à Construção': 3, 'Home Equity': 1},
+    'score_credito_devedor': {'Excelente (>800)': 5, 'Bom (600-800)': 4, 'Regular (400-600)': 2, 'Ruim (<400)': 1},
+    'patrimonio_liquido_pf': {'> R$ 1.000.000': 5, 'R$ 250k - R$ 1.000.000': 4, '< R$ 250k': 2},
+    'historico_pagamento': {'Pagamentos em dia por > 12 meses': 5, 'Pagamentos em dia por < 12 meses': 4, 'Com histórico de atrasos': 1},
+    # --- Pilar 3 ---
+    'reputacao_emissor': {'Banco de 1ª linha / Emissor especialista': 5, 'Instituição financeira média': 4, 'Securitizadora de nicho': 3, 'Emissor pouco conhecido ou com histórico negativo': 1},
+    'qualidade_servicer': {'Interna, com alta especialização': 5, 'Externa, 1ª linha': 4, 'Externa, padrão de mercado': 3, 'Servicer com histórico fraco': 1},
+    'historico_renegociacao': {'Sem histórico de renegociação': 5, 'Renegociações pontuais e bem-sucedidas': 4, 'Renegociações recorrentes ou com perdas': 1},
+}
+
+# Campos exigidos em qualquer operação; os demais dependem do tipo de lastro/devedor e do histórico
+CAMPOS_BASE = [
+    'credibilidade_avaliador', 'qualidade_comparaveis', 'estresse_valor_perc', 'fipezap_12m', 'liquidez_dias', 'risco_oferta',
+    'adequacao_produto', 'reputacao_construtora', 'estado_conservacao',
+    'analise_dominial_20a', 'dividas_propter_rem', 'cnds_verificadas', 'risco_ambiental_imovel',
+    'valor_avaliacao_imovel', 'saldo_devedor_credito', 'ltv_operacao', 'finalidade_credito', 'op_amortizacao',
+    'tipo_lastro_credito', 'historico_pagamento', 'reputacao_emissor', 'qualidade_servicer',
+]
+CAMPOS_PF = ['parcela_mensal_pf', 'renda_mensal_pf', 'score_credito_devedor', 'patrimonio_liquido_pf']
+CAMPOS_PJ = ['dl_ebitda_pj', 'liq_corrente_pj', 'dscr_pj']
+CAMPOS_CARTEIRA = ['num_devedores', 'concentracao_top5']
+CAMPOS_PERFORMANCE = ['inadimplencia_90d', 'perc_inad_30_60_dias', 'perc_inad_60_90_dias', 'perc_inad_90_180_dias',
+                      'perc_inad_acima_180_dias', 'taxa_cura_mensal', 'roll_rate_mensal', 'historico_renegociacao']
+CAMPOS_PRECIFICACAO = {'ajuste_final': 0, 'precificacao_duration_manual': 5.0, 'precificacao_ntnb': 6.15,
+                       'precificacao_cdi_proj': 10.25, 'op_volume': 0.0}
+LIMITE_MAPEAMENTO_SIMPLES = 2048
+TODOS_CAMPOS = CAMPOS_BASE + ['tipo_devedor'] + CAMPOS_PF + CAMPOS_PJ + CAMPOS_CARTEIRA + CAMPOS_PERFORMANCE
+# Campos categóricos sem nota própria (definem o caminho do cálculo), campos-lista e indicadores Sim/Não
+VALORES_PERMITIDOS = {
+    'tipo_lastro_credito': ['Crédito Único', 'Carteira de Créditos'],
+    'tipo_devedor': ['Pessoa Física', 'Pessoa Jurídica'],
+    'op_amortizacao': ['SAC', 'Price'],
+}
+CAMPOS_LISTA = ['cnds_verificadas']
+CAMPOS_NAO_NUMERICOS = set(VALORES_PERMITIDOS) | set(CAMPOS_LISTA) | {'analise_dominial_20a', 'dividas_propter_rem'}
+CAMPOS_NUMERICOS = [c for c in TODOS_CAMPOS if c not in MAPAS and c not in CAMPOS_NAO_NUMERICOS]
+
+# ==============================================================================
+# FUNÇÕES AUXILIARES
+# ==============================================================================
+
+def campos_necessarios(dados):
+    """Lista os campos de entrada relevantes para a operação, conforme lastro, devedor e histórico."""
+    campos = list(CAMPOS_BASE)
+    if dados.get('tipo_lastro_credito') == 'Crédito Único':
+        campos.append('tipo_devedor')
+        campos.extend(CAMPOS_PF if dados.get('tipo_devedor') == 'Pessoa Física' else CAMPOS_PJ)
+    else:
+        campos.extend(CAMPOS_CARTEIRA)
+    if dados.get('historico_pagamento') != HISTORICO_NOVO:
+        campos.extend(CAMPOS_PERFORMANCE)
+    return campos
+
+def _numero_finito(valor):
+    if isinstance(valor, bool): return False
+    try:
+        return math.isfinite(float(valor))
+    except (TypeError, ValueError):
+        return False
+
+def _categoria_valida(valor, permitidos):
+    # Listas e dicts não são hasheáveis: só textos são procurados no mapa
+    return isinstance(valor, str) and valor in permitidos
+
+def validar_operacao(dados):
+    """Retorna a lista de erros de preenchimento de uma operação (vazia se a operação for válida)."""
+    erros = []
+    for campo in campos_necessarios(dados):
+        valor = dados.get(campo)
+        if valor is None:
+            erros.append(f"Campo ausente: {campo}")
+        elif campo == 'historico_pagamento':
+            continue
+        elif campo in MAPAS and not _categoria_valida(valor, MAPAS[campo]):
+            erros.append(f"Valor inválido para {campo}: {valor!r}")
+        elif campo in VALORES_PERMITIDOS and not _categoria_valida(valor, VALORES_PERMITIDOS[campo]):
+            erros.append(f"Valor inválido para {campo}: {valor!r}")
+        elif campo in CAMPOS_LISTA and not isinstance(valor, (list, tuple, set)):
+            erros.append(f"Lista inválida para {campo}: {valor!r}")
+        elif campo in CAMPOS_NUMERICOS and not _numero_finito(valor):
+            erros.append(f"Valor não numérico para {campo}: {valor!r}")
+    historico = dados.get('historico_pagamento')
+    if historico is not None and historico != HISTORICO_NOVO and not _categoria_valida(historico, MAPAS['historico_pagamento']):
+        erros.append(f"Valor inválido para historico_pagamento: {historico!r}")
+    # Parâmetros de precificação são opcionais (há padrão), mas, se informados, precisam ser números
+    for campo in CAMPOS_PRECIFICACAO:
+        valor = dados.get(campo)
+        if valor is not None and not _numero_finito(valor):
+            erros.append(f"Valor não numérico para {campo}: {valor!r}")
+        elif campo == 'ajuste_final' and valor is not None and not float(valor).is_integer():
+            erros.append(f"Ajuste final deve ser um número inteiro de notches: {valor!r}")
+    return erros
+
+def _colunas_operacao(dados):
+    """Converte uma única operação (dict ou st.session_state) em colunas de tamanho 1."""
+    colunas = {}
+    for campo in TODOS_CAMPOS + list(CAMPOS_PRECIFICACAO):
+        valor = np.empty(1, dtype=object)
+        valor[0] = dados[campo] if campo in dados else None
+        colunas[campo] = valor
+    return colunas
+
+def colunas_lote(df):
+    """Converte um DataFrame de operações em colunas, preenchendo campos ausentes com None."""
+    return {campo: (df[campo].to_numpy() if campo in df.columns else np.full(len(df), None, dtype=object))
+            for campo in TODOS_CAMPOS + list(CAMPOS_PRECIFICACAO)}
+
+def _colunas_registros(operacoes):
+    """Converte uma lista de operações (dicts) em colunas, preenchendo campos ausentes com None."""
+    colunas = {}
+    for campo in TODOS_CAMPOS + list(CAMPOS_PRECIFICACAO):
+        valores = np.empty(len(operacoes), dtype=object)
+        valores[:] = [op.get(campo) for op in operacoes]
+        colunas[campo] = valores
+    return colunas
+
+def _num(c, campo):
+    try:
+        return np.asarray(c[campo], dtype=float)
+    except (TypeError, ValueError):
+        return pd.to_numeric(pd.Series(c[campo]), errors='coerce').to_numpy(dtype=float)
+
+def _mapear(valores, mapa):
+    # Em lotes pequenos, pd.Series.map custaria mais do que o próprio cálculo
+    if len(valores) > LIMITE_MAPEAMENTO_SIMPLES:
+        return pd.Series(valores, dtype=object).map(mapa).to_numpy(dtype=float)
+    return np.fromiter((mapa.get(v, np.nan) if isinstance(v, str) else np.nan for v in valores), dtype=float, count=len(valores))
+
+def _cat(c, campo):
+    return _mapear(c[campo], MAPAS[campo])
+
+def _contar_itens(valores):
+    return np.array([len(v) if isinstance(v, (list, tuple, set)) else (int(v) if isinstance(v, (int, float)) and v == v else 0)
+                     for v in valores], dtype=float)
+
+def _faixas(valores, condicoes, notas, nota_padrao):
+    return np.select(condicoes, notas, default=nota_padrao).astype(float)
+
+# ==============================================================================
+# FUNÇÕES DE CÁLCULO DE SCORE (POR SUBFATOR)
+# ==============================================================================
+
+def calcular_ltv_estressado(valor_imovel, estresse_valor_perc, saldo_devedor):
+    """Retorna (valor estressado do imóvel, LTV estressado em %); LTV = 999 quando o valor estressado é nulo."""
+    valor_estressado = np.asarray(valor_imovel, dtype=float) * (1 - np.asarray(estresse_valor_perc, dtype=float) / 100)
+    ltv_estressado = np.where(valor_estressado > 0, np.asarray(saldo_devedor, dtype=float) / np.where(valor_estressado > 0, valor_estressado, 1) * 100, 999)
+    return valor_estressado, ltv_estressado
+
+def score_p1_avaliacao_localizacao(c):
+    _, ltv_estressado = calcular_ltv_estressado(_num(c, 'valor_avaliacao_imovel'), _num(c, 'estresse_valor_perc'), _num(c, 'saldo_devedor_credito'))
+    fipezap = _num(c, 'fipezap_12m')
+    liquidez_dias = _num(c, 'liquidez_dias')
+    notas = [
+        _cat(c, 'credibilidade_avaliador'),
+        _cat(c, 'qualidade_comparaveis'),
+        _faixas(ltv_estressado, [ltv_estressado < 70, ltv_estressado < 85], [5, 3], 1),
+        _faixas(fipezap, [fipezap > 7.5, fipezap > 0], [5, 4], 2),
+        _faixas(liquidez_dias, [liquidez_dias <= 90, liquidez_dias <= 180], [5, 3], 1),
+        _cat(c, 'risco_oferta'),
+    ]
+    return np.mean(notas, axis=0)
+
+def score_p1_fisico(c):
+    return np.mean([_cat(c, 'adequacao_produto'), _cat(c, 'reputacao_construtora'), _cat(c, 'estado_conservacao')], axis=0)
+
+def score_p1_legal(c):
+    notas = [
+        np.where(c['analise_dominial_20a'].astype(bool), 5.0, 2.0),
+        np.where(c['dividas_propter_rem'].astype(bool), 5.0, 1.0),
+        np.minimum(5.0, 1 + _contar_itens(c['cnds_verificadas'])),
+        _cat(c, 'risco_ambiental_imovel'),
+    ]
+    return np.mean(notas, axis=0)
+
+def score_p2_credito(c):
+    ltv = _num(c, 'ltv_operacao')
+    notas = [
+        _faixas(ltv, [ltv < 50, ltv <= 70], [5, 3], 1),
+        _cat(c, 'finalidade_credito'),
+        np.where(c['op_amortizacao'] == 'SAC', 5.0, 4.0),
+    ]
+    return np.mean(notas, axis=0)
+
+def score_p2_devedor(c):
+    # --- Crédito Único, Pessoa Física ---
+    renda = _num(c, 'renda_mensal_pf')
+    dti = np.where(renda > 0, _num(c, 'parcela_mensal_pf') / np.where(renda > 0, renda, 1) * 100, 999)
+    score_pf = np.mean([
+        _faixas(dti, [dti <= 30, dti <= 40], [5, 3], 1),
+        _cat(c, 'score_credito_devedor'),
+        _cat(c, 'patrimonio_liquido_pf'),
+    ], axis=0)
+
+    # --- Crédito Único, Pessoa Jurídica ---
+    dl_ebitda, liq_corr, dscr = _num(c, 'dl_ebitda_pj'), _num(c, 'liq_corrente_pj'), _num(c, 'dscr_pj')
+    score_pj = np.mean([
+        _faixas(dl_ebitda, [dl_ebitda < 2.0, dl_ebitda <= 4.0], [5, 3], 1),
+        _faixas(liq_corr, [liq_corr > 1.5, liq_corr >= 1.0], [5, 3], 1),
+        _faixas(dscr, [dscr > 1.5, dscr >= 1.2], [5, 3], 1),
+    ], axis=0)
+
+    # --- Carteira de Créditos ---
+    num_dev, conc_top5 = _num(c, 'num_devedores'), _num(c, 'concentracao_top5')
+    score_carteira = np.mean([
+        _faixas(num_dev, [num_dev > 50, num_dev > 10], [5, 4], 2),
+        _faixas(conc_top5, [conc_top5 < 30, conc_top5 <= 50], [5, 3], 1),
+    ], axis=0)
+
+    credito_unico = c['tipo_lastro_credito'] == 'Crédito Único'
+    pessoa_fisica = c['tipo_devedor'] == 'Pessoa Física'
+    return np.where(credito_unico, np.where(pessoa_fisica, score_pf, score_pj), score_carteira)
+
+def score_p2_performance(c):
+    inad_90d = _num(c, 'inadimplencia_90d')
+    score_historico = np.mean([
+        _cat(c, 'historico_pagamento'),
+        _faixas(inad_90d, [inad_90d == 0, inad_90d <= 2], [5, 3], 1),
+    ], axis=0)
+    return np.where(c['historico_pagamento'] == HISTORICO_NOVO, 4.0, score_historico)
+
+def score_p3_estrutura(c):
+    return np.mean([_cat(c, 'reputacao_emissor'), _cat(c, 'qualidade_servicer')], axis=0)
+
+def score_p3_performance(c):
+    inad_ponderada = (_num(c, 'perc_inad_30_60_dias') * 1 + _num(c, 'perc_inad_60_90_dias') * 2 +
+                      _num(c, 'perc_inad_90_180_dias') * 4 + _num(c, 'perc_inad_acima_180_dias') * 8)
+    taxa_cura, roll_rate = _num(c, 'taxa_cura_mensal'), _num(c, 'roll_rate_mensal')
+    score_historico = np.mean([
+        _faixas(inad_ponderada, [inad_ponderada <= 2, inad_ponderada <= 5, inad_ponderada <= 10, inad_ponderada <= 20], [5, 4, 3, 2], 1),
+        _faixas(taxa_cura, [taxa_cura >= 50, taxa_cura >= 20], [5, 3], 1),
+        _faixas(roll_rate, [roll_rate <= 1, roll_rate <= 3], [5, 3], 1),
+        _cat(c, 'historico_renegociacao'),
+    ], axis=0)
+    return np.where(c['historico_pagamento'] == HISTORICO_NOVO, 4.0, score_historico)
+
+# ==============================================================================
+# FUNÇÕES DE CÁLCULO DE SCORE (POR PILAR)
+# ==============================================================================
+
+def combinar_pilar1(aval_loc, fisico, legal):
+    return (aval_loc * 0.50) + (fisico * 0.25) + (legal * 0.25)
+
+def combinar_pilar2(credito, devedor, performance):
+    return (credito * 0.40) + (devedor * 0.40) + (performance * 0.20)
+
+def combinar_pilar3(estrutura, performance, historico_pagamento):
+    # Ponderação INVERTIDA: operações novas dependem mais da estrutura
+    peso_estrutura = np.where(historico_pagamento == HISTORICO_NOVO, 0.8, 0.3)
+    return (estrutura * peso_estrutura) + (performance * (1 - peso_estrutura))
+
+def _pilar1(c):
+    return combinar_pilar1(score_p1_avaliacao_localizacao(c), score_p1_fisico(c), score_p1_legal(c))
+
+def _pilar2(c):
+    return combinar_pilar2(score_p2_credito(c), score_p2_devedor(c), score_p2_performance(c))
+
+def _pilar3(c):
+    return combinar_pilar3(score_p3_estrutura(c), score_p3_performance(c), c['historico_pagamento'])
+
+# Subfatores de cada pilar e os campos de entrada de que dependem
+SUBFATORES = {
+    'p1_avaliacao_localizacao': (['credibilidade_avaliador', 'qualidade_comparaveis', 'valor_avaliacao_imovel', 'estresse_valor_perc',
+                                  'saldo_devedor_credito', 'fipezap_12m', 'liquidez_dias', 'risco_oferta'], score_p1_avaliacao_localizacao),
+    'p1_fisico': (['adequacao_produto', 'reputacao_construtora', 'estado_conservacao'], score_p1_fisico),
+    'p1_legal': (['analise_dominial_20a', 'dividas_propter_rem', 'cnds_verificadas', 'risco_ambiental_imovel'], score_p1_legal),
+    'p2_credito': (['ltv_operacao', 'finalidade_credito', 'op_amortizacao'], score_p2_credito),
+    'p2_devedor': (['tipo_lastro_credito', 'tipo_devedor'] + CAMPOS_PF + CAMPOS_PJ + CAMPOS_CARTEIRA, score_p2_devedor),
+    'p2_performance': (['historico_pagamento', 'inadimplencia_90d'], score_p2_performance),
+    'p3_estrutura': (['reputacao_emissor', 'qualidade_servicer'], score_p3_estrutura),
+    'p3_performance': (['historico_pagamento', 'perc_inad_30_60_dias', 'perc_inad_60_90_dias', 'perc_inad_90_180_dias', 'perc_inad_acima_180_dias',
+                        'taxa_cura_mensal', 'roll_rate_mensal', 'historico_renegociacao'], score_p3_performance),
+}
+SUBFATORES_POR_PILAR = {
+    'pilar1': ['p1_avaliacao_localizacao', 'p1_fisico', 'p1_legal'],
+    'pilar2': ['p2_credito', 'p2_devedor', 'p2_performance'],
+    'pilar3': ['p3_estrutura', 'p3_performance'],
+}
+
+def combinar_pilares(subfatores, historico_pagamento):
+    """Scores dos 3 pilares a partir de um dict {subfator: array de scores}."""
+    return {
+        'pilar1': combinar_pilar1(*(subfatores[s] for s in SUBFATORES_POR_PILAR['pilar1'])),
+        'pilar2': combinar_pilar2(*(subfatores[s] for s in SUBFATORES_POR_PILAR['pilar2'])),
+        'pilar3': combinar_pilar3(*(subfatores[s] for s in SUBFATORES_POR_PILAR['pilar3']), historico_pagamento),
+    }
+
+def calcular_score_pilar1(dados):
+    return float(_pilar1(_colunas_operacao(dados))[0])
+
+def calcular_score_pilar2(dados):
+    return float(_pilar2(_colunas_operacao(dados))[0])
+
+def calcular_score_pilar3(dados):
+    return float(_pilar3(_colunas_operacao(dados))[0])
+
+def calcular_score_final(scores):
+    return sum(scores.get(p, 1) * w for p, w in PESOS_PILARES.items())
+
+# ==============================================================================
+# RATING
+# ==============================================================================
+
+def converter_score_para_rating(score):
+    if score is None: return "N/A"
+    for limite, rating in LIMITES_RATING:
+        if score >= limite: return rating
+    return 'brD(sf)'
+
+def ajustar_rating(rating_base, notches):
+    try:
+        idx_base = ESCALA_RATING.index(rating_base)
+        idx_final = max(0, min(len(ESCALA_RATING) - 1, idx_base + notches))
+        return ESCALA_RATING[idx_final]
+    except (ValueError, TypeError): return rating_base
+
+def converter_scores_para_ratings(scores):
+    """Versão vetorizada de converter_score_para_rating."""
+    scores = np.asarray(scores, dtype=float)
+    return np.select([scores >= limite for limite, _ in LIMITES_RATING], [rating for _, rating in LIMITES_RATING], default='brD(sf)').astype(object)
+
+def ajustar_ratings(ratings_base, notches):
+    """Versão vetorizada de ajustar_rating (ratings fora da escala são mantidos)."""
+    ratings_base = np.asarray(ratings_base, dtype=object)
+    idx_base = _mapear(ratings_base, INDICE_RATING)
+    idx_final = np.clip(idx_base + np.asarray(notches, dtype=float), 0, len(ESCALA_RATING) - 1)
+    ajustados = np.array(ESCALA_RATING, dtype=object)[np.nan_to_num(idx_final).astype(int)]
+    return np.where(np.isnan(idx_base), ratings_base, ajustados)
+
+# ==============================================================================
+# FUNÇÕES DE CÁLCULO FINANCEIRO
+# ==============================================================================
+
+def calcular_spread_credito(rating, duration_anos, op_volume, finalidade_credito=None):
+    base_spread = MATRIZ_SPREAD_BASE.get(rating, SPREAD_PADRAO)
+    liquidity_premium = 0.30 if op_volume < 5_000_000 else 0.10
+    duration_adjustment = (duration_anos - 5) * 0.08
+    home_equity_penalty = PENALIDADE_HOME_EQUITY if finalidade_credito == 'Home Equity' else 0.0
+    total_spread = base_spread + liquidity_premium + duration_adjustment + home_equity_penalty
+    return max(0.5, total_spread)
+
+def calcular_spreads_credito(ratings, duration_anos, op_volume, finalidade_credito):
+    """Versão vetorizada de calcular_spread_credito."""
+    base_spread = np.nan_to_num(_mapear(ratings, MATRIZ_SPREAD_BASE), nan=SPREAD_PADRAO)
+    liquidity_premium = np.where(np.asarray(op_volume, dtype=float) < 5_000_000, 0.30, 0.10)
+    duration_adjustment = (np.asarray(duration_anos, dtype=float) - 5) * 0.08
+    home_equity_penalty = np.where(np.asarray(finalidade_credito, dtype=object) == 'Home Equity', PENALIDADE_HOME_EQUITY, 0.0)
+    return np.maximum(0.5, base_spread + liquidity_premium + duration_adjustment + home_equity_penalty)
+
+def calcular_taxas_indicativas(spread_cci, taxa_ntnb, cdi_proj):
+    """Retorna (taxa IPCA+ em % a.a., spread sobre CDI em % a.a.); aceita escalares ou arrays."""
+    taxa_ntnb_dec = np.asarray(taxa_ntnb, dtype=float) / 100
+    cdi_proj_dec = np.asarray(cdi_proj, dtype=float) / 100
+    inflacao_implicita = np.where(taxa_ntnb_dec > -1, ((1 + cdi_proj_dec) / (1 + taxa_ntnb_dec)) - 1, 0)
+    taxa_real_cci = taxa_ntnb_dec + (np.asarray(spread_cci, dtype=float) / 100)
+    taxa_nominal_cci = (1 + taxa_real_cci) * (1 + inflacao_implicita) - 1
+    return np.asarray(taxa_ntnb, dtype=float) + spread_cci, (taxa_nominal_cci - cdi_proj_dec) * 100
+
+def gerar_fluxo_cci(saldo_devedor, taxa_aa, prazo_meses, amortizacao, data_emissao):
+    """Cronograma mensal (SAC ou Price) como dict de arrays: mes (ano * 12 + mês - 1), saldo_inicial, juros, amortizacao, parcela, saldo_final."""
+    prazo_meses = int(prazo_meses)
+    taxa_mensal = (1 + taxa_aa / 100) ** (1 / 12) - 1
+    periodos = np.arange(1, prazo_meses + 1)
+    if amortizacao == 'SAC':
+        amortizacoes = np.full(prazo_meses, saldo_devedor / prazo_meses)
+        saldo_inicial = saldo_devedor - amortizacoes * (periodos - 1)
+        juros = saldo_inicial * taxa_mensal
+    else:
+        parcela = -npf.pmt(taxa_mensal, prazo_meses, saldo_devedor)
+        fator = (1 + taxa_mensal) ** (periodos - 1)
+        saldo_inicial = saldo_devedor * fator - (parcela * (fator - 1) / taxa_mensal if taxa_mensal else parcela * (periodos - 1))
+        juros = saldo_inicial * taxa_mensal
+        amortizacoes = parcela - juros
+    mes_emissao = data_emissao.year * 12 + data_emissao.month - 1
+    return {
+        'mes': (mes_emissao + periodos).astype(np.int32),
+        'saldo_inicial': saldo_inicial,
+        'juros': juros,
+        'amortizacao': amortizacoes,
+        'parcela': juros + amortizacoes,
+        'saldo_final': saldo_inicial - amortizacoes,
+    }
+
+def calcular_duration(parcelas, taxa_aa):
+    """Duration de Macaulay (anos) de um fluxo mensal, descontado à taxa anual informada (% a.a.)."""
+    parcelas = np.asarray(parcelas, dtype=float)
+    anos = np.arange(1, len(parcelas) + 1) / 12
+    valor_presente = parcelas * (1 + taxa_aa / 100) ** (-anos)
+    total = valor_presente.sum()
+    return float((anos * valor_presente).sum() / total) if total > 0 else 0.0
+
+# ==============================================================================
+# PROCESSAMENTO EM LOTE
+# ==============================================================================
+
+def avaliar_colunas(c):
+    """Calcula scores, ratings, spread e taxas indicativas a partir de colunas de operações; retorna um dict de arrays."""
+    return derivar_resultado({'pilar1': _pilar1(c), 'pilar2': _pilar2(c), 'pilar3': _pilar3(c)}, c)
+
+def derivar_resultado(pilares, c):
+    """Score final, ratings, spread e taxas a partir dos scores dos pilares e dos campos de precificação em `c`."""
+    resultado = dict(pilares)
+    resultado['score_final'] = sum(resultado[p] * w for p, w in PESOS_PILARES.items())
+    resultado['rating_indicado'] = converter_scores_para_ratings(resultado['score_final'])
+
+    precificacao = {campo: np.nan_to_num(_num(c, campo), nan=padrao) for campo, padrao in CAMPOS_PRECIFICACAO.items()}
+    resultado['rating_final'] = ajustar_ratings(resultado['rating_indicado'], precificacao['ajuste_final'])
+    resultado['spread_credito'] = calcular_spreads_credito(resultado['rating_final'], precificacao['precificacao_duration_manual'],
+                                                           precificacao['op_volume'], c['finalidade_credito'])
+    resultado['taxa_ipca'], resultado['spread_cdi'] = calcular_taxas_indicativas(
+        resultado['spread_credito'], precificacao['precificacao_ntnb'], precificacao['precificacao_cdi_proj'])
+    return resultado
+
+def avaliar_lote(df):
+    """Avalia um DataFrame de operações (uma por linha) e retorna um DataFrame com o mesmo índice."""
+    return pd.DataFrame(avaliar_colunas(colunas_lote(df)), index=df.index)
+
+def avaliar_operacoes(operacoes):
+    """Avalia uma lista de operações (dicts) sem passar por DataFrame; retorna uma lista de dicts."""
+    resultado = avaliar_colunas(_colunas_registros(operacoes))
+    colunas = [(nome, valores.tolist()) for nome, valores in resultado.items()]
+    return [{nome: valores[i] for nome, valores in colunas} for i in range(len(operacoes))]
@@ -0,0 +1,171 @@
+# perda_carteira.py
+# Distribuição de perdas de crédito da carteira de CCIs com defaults correlacionados
+# (cópula gaussiana de um fator). Cada operação recebe uma PD pelo rating final e uma
+# severidade (LGD) pelo LTV estressado do lastro, como no Pilar 1.
+#
+# Uso: python perda_carteira.py carteira.jsonl --cenarios 100000 --confianca 0.99
+import argparse
+
+import numpy as np
+import pandas as pd
+from scipy.special import ndtr, ndtri
+
+from motor_rating import avaliar_lote, calcular_ltv_estressado
+
+# PD anual indicativa por rating (escala nacional, operações estruturadas)
+PD_ANUAL_POR_RATING = {
+    'brAAA(sf)': 0.0005, 'brAA(sf)': 0.0010, 'brA(sf)': 0.0025, 'brBBB(sf)': 0.0075, 'brBB(sf)': 0.0200,
+    'brB(sf)': 0.0500, 'brCCC(sf)': 0.1500, 'brCC(sf)': 0.2500, 'brC(sf)': 0.4000, 'brD(sf)': 1.0,
+}
+CUSTO_EXECUCAO_GARANTIA = 0.10  # custos de retomada e venda, sobre o valor estressado
+LGD_MINIMA = 0.05
+CORRELACAO_PADRAO = 0.15        # correlação de ativos de Basileia para crédito imobiliário residencial
+ORCAMENTO_MEMORIA_PADRAO = 256 * 1024 ** 2
+NOS_QUADRATURA = 256
+
+# ==============================================================================
+# PARÂMETROS DAS EXPOSIÇÕES
+# ==============================================================================
+
+def parametros_exposicoes(df, horizonte_anos=1.0, coluna_id='op_codigo'):
+    """EAD, PD no horizonte e LGD por operação; calcula o rating final se a coluna não vier preenchida."""
+    ratings = df['rating_final'] if 'rating_final' in df.columns else avaliar_lote(df)['rating_final']
+    pd_anual = ratings.map(PD_ANUAL_POR_RATING)
+    if pd_anual.isna().any():
+        raise ValueError(f"Ratings sem PD associada: {sorted(ratings[pd_anual.isna()].astype(str).unique())}")
+
+    ead = pd.to_numeric(df['saldo_devedor_credito'], errors='coerce').fillna(0).to_numpy(dtype=float)
+    valor_estressado, _ = calcular_ltv_estressado(df['valor_avaliacao_imovel'], df['estresse_valor_perc'], ead)
+    recuperacao = np.minimum(ead, np.maximum(valor_estressado, 0) * (1 - CUSTO_EXECUCAO_GARANTIA))
+    lgd = np.where(ead > 0, 1 - recuperacao / np.where(ead > 0, ead, 1), 0.0)
+
+    return pd.DataFrame({
+        'ead': ead,
+        'pd': 1 - (1 - pd_anual.to_numpy(dtype=float)) ** horizonte_anos,
+        'lgd': np.clip(lgd, LGD_MINIMA, 1.0),
+    }, index=df[coluna_id] if coluna_id in df.columns else df.index)
+
+# ==============================================================================
+# DISTRIBUIÇÃO DE PERDAS
+# ==============================================================================
+
+def _resultado(exposicoes, perda_esperada, var, es, confianca, contribuicoes, metodo):
+    tabela = exposicoes.assign(perda_esperada=exposicoes['ead'] * exposicoes['pd'] * exposicoes['lgd'], **contribuicoes)
+    return {
+        'metodo': metodo, 'confianca': confianca, 'exposicao_total': float(exposicoes['ead'].sum()),
+        'perda_esperada': float(perda_esperada), 'var': float(var), 'es': float(es), 'contribuicoes': tabela,
+    }
+
+def perda_analitica(exposicoes, confianca=0.99, correlacao=CORRELACAO_PADRAO):
+    """Aproximação de carteira granular (Vasicek): a perda é a esperada condicional ao fator sistêmico.
+
+    O VaR é a perda condicional no quantil do fator; o ES integra a cauda por quadratura.
+    As contribuições marginais somam exatamente o VaR e o ES.
+    """
+    pesos = (exposicoes['ead'] * exposicoes['lgd']).to_numpy()
+    limiares = ndtri(exposicoes['pd'].to_numpy())
+    raiz_rho, raiz_idio = np.sqrt(correlacao), np.sqrt(1 - correlacao)
+
+    def pd_condicional(z):
+        return ndtr((limiares[:, None] - raiz_rho * np.atleast_1d(z)[None, :]) / raiz_idio)
+
+    z_var = ndtri(1 - confianca)  # fator adverso: defaults ocorrem quando o fator é baixo
+    contribuicao_var = pesos * pd_condicional(z_var)[:, 0]
+
+    # E[L_i | Z <= z_var] por Gauss-Legendre em [-8, z_var]
+    nos, pesos_quad = np.polynomial.legendre.leggauss(NOS_QUADRATURA)
+    a, b = -8.0, z_var
+    z = (b - a) / 2 * nos + (a + b) / 2
+    densidade = np.exp(-z ** 2 / 2) / np.sqrt(2 * np.pi) * pesos_quad * (b - a) / 2
+    contribuicao_es = pesos * (pd_condicional(z) @ densidade) / (1 - confianca)
+
+    return _resultado(exposicoes, (pesos * exposicoes['pd'].to_numpy()).sum(), contribuicao_var.sum(), contribuicao_es.sum(),
+                      confianca, {'contribuicao_var': contribuicao_var, 'contribuicao_es': contribuicao_es}, 'analitico')
+
+def perda_monte_carlo(exposicoes, n_cenarios=100_000, confianca=0.99, correlacao=CORRELACAO_PADRAO,
+                      orcamento_memoria=ORCAMENTO_MEMORIA_PADRAO, semente=42):
+    """Simulação da cópula gaussiana de um fator, em blocos de cenários limitados por `orcamento_memoria` (bytes).
+
+    Condicional ao fator sistêmico, os defaults são independentes: cada operação entra em default
+    quando um uniforme fica abaixo da PD condicional da sua classe de PD. Como as PDs vêm da
+    tabela de ratings, há poucas classes, e a PD condicional é calculada por (cenário, classe).
+
+    Em uma única passada, guarda as perdas de todos os cenários e os vetores de default
+    (compactados em bits) apenas dos cenários que podem pertencer à cauda. O ES é a média das
+    `ceil((1 - confianca) * n_cenarios)` maiores perdas; a contribuição de cada operação ao ES
+    é a sua perda média nesses cenários.
+    """
+    n = len(exposicoes)
+    pd_classes, classe = np.unique(exposicoes['pd'].to_numpy(), return_inverse=True)
+    ordem = np.argsort(classe, kind='stable')  # operações agrupadas por classe: comparações em fatias contíguas
+    cortes = np.searchsorted(classe[ordem], np.arange(len(pd_classes) + 1))
+    pesos = (exposicoes['ead'] * exposicoes['lgd']).to_numpy()[ordem].astype(np.float32)
+    limiares = ndtri(pd_classes)
+    raiz_rho, raiz_idio = np.sqrt(correlacao), np.sqrt(1 - correlacao)
+    n_cauda = max(1, int(np.ceil((1 - confianca) * n_cenarios)))
+
+    # Por célula (cenário x operação): 4 bytes do uniforme (reaproveitado para a perda) + 1 byte do indicador de default
+    bytes_cauda = n_cauda * ((n + 7) // 8) * 2
+    tamanho_bloco = int(max(1, min(n_cenarios, (orcamento_memoria - bytes_cauda) // max(1, 5 * n))))
+
+    rng = np.random.default_rng(semente)
+    perdas = np.empty(n_cenarios)
+    perdas_cauda = np.empty(0)
+    defaults_cauda = np.empty((0, (n + 7) // 8), dtype=np.uint8)
+    uniforme = np.empty((tamanho_bloco, n), dtype=np.float32)
+    default = np.empty((tamanho_bloco, n), dtype=bool)
+
+    for inicio in range(0, n_cenarios, tamanho_bloco):
+        k = min(tamanho_bloco, n_cenarios - inicio)
+        u, d = uniforme[:k], default[:k]
+        fator = rng.standard_normal(k)
+        # Fator baixo = cenário adverso
+        pd_condicional = ndtr((limiares[None, :] - raiz_rho * fator[:, None]) / raiz_idio).astype(np.float32)
+        rng.random(out=u, dtype=np.float32)
+        for j in range(len(pd_classes)):
+            np.less(u[:, cortes[j]:cortes[j + 1]], pd_condicional[:, j:j + 1], out=d[:, cortes[j]:cortes[j + 1]])
+        u[...] = d
+        perdas_bloco = u @ pesos
+        perdas[inicio:inicio + k] = perdas_bloco
+
+        # Mantém só os n_cauda piores cenários vistos até aqui
+        candidatos = np.concatenate([perdas_cauda, perdas_bloco])
+        manter = np.argpartition(candidatos, -n_cauda)[-n_cauda:] if len(candidatos) > n_cauda else np.arange(len(candidatos))
+        antigos, novos = manter[manter < len(perdas_cauda)], manter[manter >= len(perdas_cauda)] - len(perdas_cauda)
+        defaults_cauda = np.concatenate([defaults_cauda[antigos], np.packbits(d[novos], axis=1)])
+        perdas_cauda = np.concatenate([perdas_cauda[antigos], perdas_bloco[novos]])
+
+    # Contribuição ao ES: média dos defaults na cauda, desempacotada em blocos dentro do orçamento
+    frequencia_cauda = np.zeros(n)
+    linhas_bloco = max(1, orcamento_memoria // max(1, n))
+    for inicio in range(0, len(defaults_cauda), linhas_bloco):
+        frequencia_cauda += np.unpackbits(defaults_cauda[inicio:inicio + linhas_bloco], axis=1, count=n).sum(axis=0)
+    contribuicao_es = np.empty(n)
+    contribuicao_es[ordem] = pesos.astype(float) * frequencia_cauda / len(perdas_cauda)
+
+    return _resultado(exposicoes, perdas.mean(), perdas_cauda.min(), perdas_cauda.mean(), confianca,
+                      {'contribuicao_es': contribuicao_es}, 'monte_carlo') | {'perdas_cenarios': perdas}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Distribuição de perdas da carteira de CCIs (cópula gaussiana de um fator)')
+    parser.add_argument('carteira', help='Arquivo de operações (.jsonl, .json ou .csv)')
+    parser.add_argument('--metodo', choices=['monte_carlo', 'analitico'], default='monte_carlo')
+    parser.add_argument('--cenarios', type=int, default=100_000)
+    parser.add_argument('--confianca', type=float, default=0.99)
+    parser.add_argument('--correlacao', type=float, default=CORRELACAO_PADRAO)
+    parser.add_argument('--horizonte', type=float, default=1.0, help='Horizonte em anos')
+    parser.add_argument('--memoria-mb', type=int, default=ORCAMENTO_MEMORIA_PADRAO // 1024 ** 2)
+    parser.add_argument('--contribuicoes', default=None, help='CSV de saída com as contribuições por operação')
+    args = parser.parse_args()
+
+    from rerating_incremental import ler_carteira
+    exposicoes = parametros_exposicoes(ler_carteira(args.carteira), args.horizonte)
+    if args.metodo == 'analitico':
+        resultado = perda_analitica(exposicoes, args.confianca, args.correlacao)
+    else:
+        resultado = perda_monte_carlo(exposicoes, args.cenarios, args.confianca, args.correlacao, args.memoria_mb * 1024 ** 2)
+    print(f"Exposição total: R$ {resultado['exposicao_total']:,.2f}")
+    print(f"Perda esperada: R$ {resultado['perda_esperada']:,.2f}")
+    print(f"VaR {args.confianca:.1%}: R$ {resultado['var']:,.2f} | ES: R$ {resultado['es']:,.2f}")
+    if args.contribuicoes:
+        resultado['contribuicoes'].to_csv(args.contribuicoes)
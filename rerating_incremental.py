@@ -0,0 +1,214 @@
+# rerating_incremental.py
+# Re-rating incremental da carteira: cada operação recebe uma impressão digital (hash) das
+# entradas de cada subfator; numa nova rodada só são recalculados os subfatores cujas entradas
+# mudaram, e os pilares, ratings e spreads que dependem deles.
+#
+# Uso: python rerating_incremental.py carteira.jsonl --estado estado_rating.pkl --relatorio migracoes.csv
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from motor_rating import (
+    CAMPOS_PRECIFICACAO, INDICE_RATING, SUBFATORES, SUBFATORES_POR_PILAR,
+    colunas_lote, combinar_pilares, derivar_resultado,
+)
+
+GRUPOS = {**{nome: campos for nome, (campos, _) in SUBFATORES.items()},
+          'precificacao': list(CAMPOS_PRECIFICACAO) + ['finalidade_credito']}
+_SEMENTE_HASH = np.uint64(0xCBF29CE484222325)
+_MULTIPLICADOR_HASH = np.uint64(0x100000001B3)
+COLUNAS_RESULTADO = ['pilar1', 'pilar2', 'pilar3', 'score_final', 'rating_indicado', 'rating_final', 'spread_credito', 'taxa_ipca', 'spread_cdi']
+
+# ==============================================================================
+# IMPRESSÕES DIGITAIS
+# ==============================================================================
+
+def _hash_campo(serie):
+    """Hash (uint64) estável de um campo: 1 e 1.0 geram o mesmo hash; listas são comparadas sem considerar a ordem."""
+    try:
+        numerica = pd.to_numeric(serie)
+        # to_numeric converte listas vazias em NaN: só vale se nenhum valor novo virou NaN
+        if (numerica.isna() == serie.isna()).all():
+            return pd.util.hash_array(numerica.to_numpy(dtype=float))
+    except (TypeError, ValueError):
+        pass
+    valores = serie.to_numpy(dtype=object)
+    try:
+        return pd.util.hash_array(valores)
+    except TypeError:
+        # Campos-lista (ex.: cnds_verificadas) não são hasheáveis diretamente
+        return pd.util.hash_array(np.array(['|'.join(sorted(map(str, v))) if isinstance(v, (list, tuple, set)) else str(v)
+                                            for v in valores], dtype=object))
+
+def calcular_impressoes(df):
+    """Hash (uint64) das entradas de cada subfator e da precificação, por operação."""
+    hashes_campos = {}
+    impressoes = {}
+    for grupo, campos in GRUPOS.items():
+        impressao = np.full(len(df), _SEMENTE_HASH, dtype=np.uint64)
+        for campo in campos:
+            if campo not in hashes_campos:
+                serie = df[campo] if campo in df.columns else pd.Series(None, index=df.index, dtype=object)
+                hashes_campos[campo] = _hash_campo(serie)
+            # Combinação dependente da ordem dos campos (aritmética uint64 com overflow)
+            impressao = (impressao * _MULTIPLICADOR_HASH) ^ hashes_campos[campo]
+        impressoes[grupo] = impressao
+    return impressoes
+
+def combinar_impressoes(impressoes):
+    """Hash único (uint64) das entradas de todos os grupos, por operação."""
+    combinada = np.full(len(next(iter(impressoes.values()))), _SEMENTE_HASH, dtype=np.uint64)
+    for grupo in GRUPOS:
+        combinada = (combinada * _MULTIPLICADOR_HASH) ^ impressoes[grupo]
+    return combinada
+
+# ==============================================================================
+# RE-RATING
+# ==============================================================================
+
+def rerating_incremental(df, estado_anterior=None, coluna_id='op_codigo'):
+    """Reavalia a carteira reaproveitando o estado da rodada anterior.
+
+    Retorna um dict com:
+      - 'estado': DataFrame indexado pela operação (hashes, scores de subfatores e resultado), a ser salvo para a próxima rodada;
+      - 'migracoes': operações novas, removidas ou com mudança de rating final;
+      - 'resumo': contagens da rodada;
+      - 'recalculadas': operações cujo resultado foi recalculado nesta rodada.
+    """
+    if df[coluna_id].duplicated().any():
+        raise ValueError(f"Identificadores duplicados na coluna '{coluna_id}'.")
+    df = df.set_index(coluna_id, drop=False)
+    n = len(df)
+    impressoes = calcular_impressoes(df)
+
+    if estado_anterior is None or estado_anterior.empty:
+        posicoes = np.full(n, -1)
+    else:
+        posicoes = estado_anterior.index.get_indexer(df.index)
+    novas = posicoes < 0
+
+    def anterior(coluna, dtype):
+        valores = np.empty(n, dtype=dtype)
+        if not novas.all():
+            valores[~novas] = estado_anterior[coluna].to_numpy()[posicoes[~novas]]
+        return valores
+
+    alterados = {grupo: novas | (impressoes[grupo] != anterior(f'hash_{grupo}', np.uint64)) for grupo in GRUPOS}
+    linhas_alteradas = np.logical_or.reduce(list(alterados.values())) if alterados else np.zeros(n, dtype=bool)
+
+    # Colunas apenas das operações com alguma mudança: o custo de recálculo acompanha o número de alterações
+    posicoes_alteradas = np.flatnonzero(linhas_alteradas)
+    c = colunas_lote(df.iloc[posicoes_alteradas])
+    local = np.full(n, -1)
+    local[posicoes_alteradas] = np.arange(len(posicoes_alteradas))
+
+    subfatores = {}
+    for nome, (_, funcao) in SUBFATORES.items():
+        scores = anterior(f'score_{nome}', float)
+        mascara = alterados[nome]
+        if mascara.any():
+            scores[mascara] = funcao({campo: valores[local[mascara]] for campo, valores in c.items()})
+        subfatores[nome] = scores
+
+    pilares_alterados = np.logical_or.reduce([alterados[s] for subs in SUBFATORES_POR_PILAR.values() for s in subs])
+    afetadas = pilares_alterados | alterados['precificacao']
+    resultado = {coluna: anterior(coluna, object if coluna.startswith('rating') else float) for coluna in COLUNAS_RESULTADO}
+    if afetadas.any():
+        c_afetadas = {campo: valores[local[afetadas]] for campo, valores in c.items()}
+        pilares = combinar_pilares({nome: scores[afetadas] for nome, scores in subfatores.items()}, c_afetadas['historico_pagamento'])
+        for coluna, valores in derivar_resultado(pilares, c_afetadas).items():
+            resultado[coluna][afetadas] = valores
+
+    estado = pd.DataFrame({
+        **{f'hash_{grupo}': hashes for grupo, hashes in impressoes.items()},
+        **{f'score_{nome}': scores for nome, scores in subfatores.items()},
+        **resultado,
+    }, index=df.index)
+
+    migracoes = relatorio_migracoes(estado_anterior, estado, alterados, df.index)
+    resumo = {
+        'operacoes': n,
+        'novas': int(novas.sum()),
+        'removidas': int((migracoes['situacao'] == 'Removida').sum()),
+        'recalculadas': int(afetadas.sum()),
+        'subfatores_recalculados': {nome: int(alterados[nome].sum()) for nome in SUBFATORES},
+        'migracoes_rating': int(migracoes['situacao'].isin(['Upgrade', 'Downgrade']).sum()),
+    }
+    return {'estado': estado, 'migracoes': migracoes, 'resumo': resumo, 'recalculadas': df.index[afetadas]}
+
+def relatorio_migracoes(estado_anterior, estado, alterados, ids):
+    """Operações com mudança de rating final (com os subfatores que mudaram), além das novas e removidas."""
+    atual = estado['rating_final']
+    if estado_anterior is None or estado_anterior.empty:
+        anterior = pd.Series(None, index=estado.index, dtype=object)
+        removidas = pd.Index([])
+    else:
+        anterior = estado_anterior['rating_final'].reindex(estado.index)
+        removidas = estado_anterior.index.difference(estado.index)
+
+    delta = atual.map(INDICE_RATING) - anterior.map(INDICE_RATING)
+    mudou = (anterior.isna() | (delta != 0)).to_numpy()
+    subfatores_alterados = [', '.join(g for g in SUBFATORES if alterados[g][i]) for i in np.flatnonzero(mudou)]
+    migracoes = pd.DataFrame({
+        'rating_anterior': anterior[mudou], 'rating_atual': atual[mudou], 'variacao_notches': delta[mudou],
+        'subfatores_alterados': subfatores_alterados,
+    }, index=ids[mudou])
+    migracoes['situacao'] = np.select([migracoes['rating_anterior'].isna(), migracoes['variacao_notches'] > 0], ['Nova', 'Upgrade'], 'Downgrade')
+
+    if len(removidas):
+        migracoes = pd.concat([migracoes, pd.DataFrame({
+            'rating_anterior': estado_anterior.loc[removidas, 'rating_final'], 'rating_atual': None,
+            'variacao_notches': np.nan, 'subfatores_alterados': '', 'situacao': 'Removida',
+        }, index=removidas)])
+    return migracoes
+
+def matriz_migracao(estado_anterior, estado):
+    """Matriz de migração do rating final entre duas rodadas (operações presentes em ambas)."""
+    comuns = estado_anterior.index.intersection(estado.index)
+    return pd.crosstab(estado_anterior.loc[comuns, 'rating_final'], estado.loc[comuns, 'rating_final'],
+                       rownames=['Rating anterior'], colnames=['Rating atual'])
+
+# ==============================================================================
+# PERSISTÊNCIA E LINHA DE COMANDO
+# ==============================================================================
+
+def carregar_estado(caminho):
+    return pd.read_pickle(caminho) if caminho and os.path.exists(caminho) else None
+
+def salvar_estado(estado, caminho):
+    temporario = caminho + '.tmp'
+    estado.to_pickle(temporario)
+    os.replace(temporario, caminho)
+
+def ler_carteira(caminho):
+    if caminho.endswith('.jsonl'): return pd.read_json(caminho, lines=True)
+    if caminho.endswith('.json'): return pd.read_json(caminho)
+    return pd.read_csv(caminho)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Re-rating incremental da carteira de CCIs')
+    parser.add_argument('carteira', help='Arquivo de operações (.jsonl, .json ou .csv), uma operação por linha')
+    parser.add_argument('--estado', default='estado_rating.pkl', help='Estado da rodada anterior (atualizado ao final)')
+    parser.add_argument('--relatorio', default=None, help='CSV de saída com as migrações de rating')
+    parser.add_argument('--coluna-id', default='op_codigo')
+    parser.add_argument('--historico', default=None, help='Diretório do histórico de ratings onde registrar os eventos da rodada')
+    args = parser.parse_args()
+
+    estado_anterior = carregar_estado(args.estado)
+    carteira = ler_carteira(args.carteira)
+    rodada = rerating_incremental(carteira, estado_anterior, args.coluna_id)
+    salvar_estado(rodada['estado'], args.estado)
+    if args.historico:
+        from historico_ratings import HistoricoRatings
+        historico = HistoricoRatings(args.historico)
+        recalculadas = rodada['recalculadas']
+        historico.registrar_resultado(carteira.set_index(args.coluna_id, drop=False).loc[recalculadas],
+                                      rodada['estado'].loc[recalculadas], coluna_id=args.coluna_id)
+        historico.registrar_baixas(rodada['migracoes'].index[rodada['migracoes']['situacao'] == 'Removida'])
+    if args.relatorio:
+        rodada['migracoes'].to_csv(args.relatorio, index_label=args.coluna_id)
+    print(rodada['resumo'])
+    if estado_anterior is not None:
+        print(matriz_migracao(estado_anterior, rodada['estado']))
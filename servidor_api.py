@@ -0,0 +1,234 @@
+# servidor_api.py
+# Serviço HTTP local de scoring e precificação de CCIs, sem sessão Streamlit.
+# Requisições concorrentes de operações individuais são agrupadas em micro-lotes
+# e avaliadas de forma vetorizada pelo motor_rating.
+#
+# Uso: python servidor_api.py --porta 8502
+#   POST /v1/rating        -> uma operação (JSON no mesmo formato da análise salva pelo app)
+#   POST /v1/rating/lote   -> lista de operações
+#   GET  /v1/metricas      -> latência (p50/p95/p99), volume e tamanho médio dos lotes
+#   GET  /saude
+#
+# Com --indices-precos <diretório>, `fipezap_12m` e `liquidez_dias` ausentes são preenchidos
+# pela base local de índices (região em `cidade_mapa`, mês de `data_referencia` ou o atual);
+# datas além da defasagem máxima da base ficam sem preenchimento e a operação é recusada (400).
+#
+# Vazão (benchmark_api.py, máquina de 1 núcleo dividido com os clientes, 2 processos x 32
+# conexões keep-alive): ~870 req/s em /v1/rating, com micro-lotes de ~15 operações e p50 de
+# 16 ms no servidor; ~12.000 operações/s em /v1/rating/lote com lotes de 500. O limite de
+# /v1/rating é o tratamento HTTP por requisição do http.server em um único processo Python,
+# não o cálculo: para milhares de operações/s use /v1/rating/lote ou vários processos.
+import argparse
+import datetime
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from indice_precos import BaseIndicesPrecos, mes_absoluto
+from motor_rating import avaliar_operacoes, validar_operacao
+
+# ==============================================================================
+# MICRO-LOTES E MÉTRICAS
+# ==============================================================================
+
+class RegistroLatencia:
+    """Janela circular de latências (em ms) para cálculo de percentis."""
+
+    def __init__(self, capacidade=100_000):
+        self._amostras = np.zeros(capacidade, dtype=float)
+        self._total = 0
+        self._lotes = 0
+        self._itens_em_lotes = 0
+        self._lock = threading.Lock()
+
+    def registrar(self, latencia_ms):
+        with self._lock:
+            self._amostras[self._total % len(self._amostras)] = latencia_ms
+            self._total += 1
+
+    def registrar_lote(self, tamanho):
+        with self._lock:
+            self._lotes += 1
+            self._itens_em_lotes += tamanho
+
+    def resumo(self):
+        with self._lock:
+            amostras = self._amostras[:min(self._total, len(self._amostras))].copy()
+            total, lotes, itens = self._total, self._lotes, self._itens_em_lotes
+        p50, p95, p99 = np.percentile(amostras, [50, 95, 99]) if len(amostras) else (0.0, 0.0, 0.0)
+        return {
+            'requisicoes': total, 'lotes': lotes,
+            'tamanho_medio_lote': itens / lotes if lotes else 0.0,
+            'latencia_ms': {'p50': float(p50), 'p95': float(p95), 'p99': float(p99)},
+        }
+
+class AgrupadorMicroLotes:
+    """Agrupa operações enviadas por threads diferentes e as avalia em lotes vetorizados.
+
+    Uma thread dedicada espera a primeira operação da fila e, a partir dela, acumula
+    novas operações por até `janela_ms` ou até atingir `tamanho_max`.
+    """
+
+    def __init__(self, tamanho_max=512, janela_ms=2.0, metricas=None):
+        self.tamanho_max = tamanho_max
+        self.janela_s = janela_ms / 1000
+        self.metricas = metricas or RegistroLatencia()
+        self._fila = queue.Queue()
+        self._thread = threading.Thread(target=self._executar, name='micro-lotes', daemon=True)
+        self._thread.start()
+
+    def submeter(self, operacao):
+        futuro = Future()
+        self._fila.put((operacao, futuro))
+        return futuro
+
+    def _executar(self):
+        while True:
+            pendentes = [self._fila.get()]
+            limite = time.perf_counter() + self.janela_s
+            while len(pendentes) < self.tamanho_max:
+                restante = limite - time.perf_counter()
+                try:
+                    pendentes.append(self._fila.get(timeout=restante) if restante > 0 else self._fila.get_nowait())
+                except queue.Empty:
+                    break
+            self._avaliar(pendentes)
+
+    def _avaliar(self, pendentes):
+        self.metricas.registrar_lote(len(pendentes))
+        try:
+            resultado = avaliar_operacoes([operacao for operacao, _ in pendentes])
+            for (_, futuro), linha in zip(pendentes, resultado):
+                futuro.set_result(linha)
+        except Exception as e:
+            for _, futuro in pendentes:
+                if not futuro.done(): futuro.set_exception(e)
+
+# ==============================================================================
+# SERVIDOR HTTP
+# ==============================================================================
+
+class ManipuladorRating(BaseHTTPRequestHandler):
+    agrupador = None  # definido em criar_servidor
+    base_indices_precos = None
+    timeout_resposta_s = 10.0
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass  # o log por requisição custaria mais do que a própria avaliação
+
+    def _responder(self, status, corpo):
+        dados = json.dumps(corpo, ensure_ascii=False, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def _ler_json(self):
+        tamanho = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(tamanho) or b'null')
+
+    def _preencher_indices(self, operacao):
+        """Completa FipeZAP e liquidez ausentes pela base local; ValueError se a região ou a data forem inválidas."""
+        if self.base_indices_precos is None: return operacao
+        faltantes = [c for c in ('fipezap_12m', 'liquidez_dias') if operacao.get(c) is None]
+        if not faltantes: return operacao
+        regiao = operacao.get('cidade_mapa')
+        if regiao is not None and not isinstance(regiao, str):
+            raise ValueError(f"Valor inválido para cidade_mapa: {regiao!r}")
+        data = operacao.get('data_referencia') or datetime.date.today()
+        try:
+            valida = isinstance(data, (str, datetime.date)) and isinstance(mes_absoluto(data), int)
+        except (TypeError, ValueError):
+            valida = False
+        if not valida:
+            raise ValueError(f"Valor inválido para data_referencia: {data!r} (use 'AAAA-MM' ou 'AAAA-MM-DD')")
+        consultas = {'fipezap_12m': self.base_indices_precos.variacao_12m, 'liquidez_dias': self.base_indices_precos.liquidez_dias}
+        return {**operacao, **{c: consultas[c](regiao, data) for c in faltantes}}
+
+    def do_GET(self):
+        if self.path == '/saude':
+            self._responder(200, {'status': 'ok'})
+        elif self.path == '/v1/metricas':
+            self._responder(200, self.agrupador.metricas.resumo())
+        else:
+            self._responder(404, {'erro': 'Rota não encontrada'})
+
+    def do_POST(self):
+        inicio = time.perf_counter()
+        try:
+            corpo = self._ler_json()
+        except (ValueError, UnicodeDecodeError) as e:
+            return self._responder(400, {'erro': f'JSON inválido: {e}'})
+
+        if self.path == '/v1/rating':
+            if not isinstance(corpo, dict):
+                return self._responder(400, {'erro': 'Esperado um objeto JSON com a operação'})
+            try:
+                corpo = self._preencher_indices(corpo)
+            except ValueError as e:
+                return self._responder(400, {'erros': [str(e)]})
+            erros = validar_operacao(corpo)
+            if erros:
+                return self._responder(400, {'erros': erros})
+            try:
+                resposta = self.agrupador.submeter(corpo).result(timeout=self.timeout_resposta_s)
+            except Exception as e:
+                return self._responder(500, {'erro': str(e)})
+        elif self.path == '/v1/rating/lote':
+            if not isinstance(corpo, list):
+                return self._responder(400, {'erro': 'Esperada uma lista de operações'})
+            erros = {}
+            for i, op in enumerate(corpo):
+                if not isinstance(op, dict):
+                    erros[i] = ['Operação não é um objeto JSON']
+                    continue
+                try:
+                    corpo[i] = self._preencher_indices(op)
+                except ValueError as e:
+                    erros[i] = [str(e)]
+                    continue
+                erros_op = validar_operacao(corpo[i])
+                if erros_op: erros[i] = erros_op
+            if erros:
+                return self._responder(400, {'erros': erros})
+            # Lotes explícitos já são vetorizados; não passam pelo agrupador
+            resposta = avaliar_operacoes(corpo) if corpo else []
+        else:
+            return self._responder(404, {'erro': 'Rota não encontrada'})
+
+        self._responder(200, resposta)
+        self.agrupador.metricas.registrar((time.perf_counter() - inicio) * 1000)
+
+class ServidorRating(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+def criar_servidor(host='127.0.0.1', porta=8502, tamanho_max_lote=512, janela_ms=2.0, diretorio_indices_precos=None):
+    manipulador = type('ManipuladorRatingConfigurado', (ManipuladorRating,), {
+        'agrupador': AgrupadorMicroLotes(tamanho_max=tamanho_max_lote, janela_ms=janela_ms),
+        'base_indices_precos': BaseIndicesPrecos.de_diretorio(diretorio_indices_precos) if diretorio_indices_precos else None,
+    })
+    return ServidorRating((host, porta), manipulador)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serviço HTTP local de rating e precificação de CCIs')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--porta', type=int, default=8502)
+    parser.add_argument('--lote-max', type=int, default=512, help='Número máximo de operações por micro-lote')
+    parser.add_argument('--janela-ms', type=float, default=2.0, help='Tempo máximo de espera para completar um micro-lote')
+    parser.add_argument('--indices-precos', default=None, help='Diretório com as séries locais de índice de preço e tempo de venda')
+    args = parser.parse_args()
+
+    servidor = criar_servidor(args.host, args.porta, args.lote_max, args.janela_ms, args.indices_precos)
+    print(f"Servindo em http://{args.host}:{args.porta} (lote máx. {args.lote_max}, janela {args.janela_ms} ms)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        servidor.server_close()
@@ -0,0 +1,19 @@
+# trava_arquivo.py
+# Trava exclusiva entre processos sobre um arquivo, usada pelos armazéns só por acréscimo
+# (histórico de ratings e fluxos de caixa) para serializar escritores concorrentes.
+import contextlib
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos (um único escritor por vez)
+    fcntl = None
+
+@contextlib.contextmanager
+def trava_exclusiva(caminho):
+    """Mantém o arquivo `caminho` travado (flock exclusivo) enquanto o bloco executa."""
+    with open(caminho, 'a') as trava:
+        if fcntl: fcntl.flock(trava, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl: fcntl.flock(trava, fcntl.LOCK_UN)